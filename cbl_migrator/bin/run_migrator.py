@@ -1,17 +1,125 @@
 from cbl_migrator import DbMigrator
+from cbl_migrator.lease import LeaseTable
+from cbl_migrator.logs import setup_logger
+from cbl_migrator.worker import run_worker
 import argparse
+import json
+import os
 import sys
 
 
-def run(origin, dest, n_workers, copy_schema, copy_data, copy_constraints, copy_indexes, chunk_size):
-    migrator = DbMigrator(origin, dest, n_workers=int(n_workers))
-    migrator.migrate(copy_schema=copy_schema, copy_data=copy_data,
-                     copy_constraints=copy_constraints, copy_indexes=copy_indexes, chunk_size=int(chunk_size))
+DISTRIBUTED_COMMANDS = ('publish', 'worker', 'progress', 'finalize')
+
+
+def add_logging_arguments(parser, log_file):
+    parser.add_argument('--log_file',
+                        help='Rotating log file',
+                        default=log_file)
+    parser.add_argument('--log_json',
+                        help='Write the log file as JSON lines',
+                        action='store_true')
+    parser.add_argument('--log_chunk_rate',
+                        help='Max per-chunk debug log records per second and table',
+                        default=1)
+
+
+def setup_logging(args):
+    setup_logger(log_file=args.log_file, json_format=args.log_json,
+                 chunk_rate=float(args.log_chunk_rate))
+
+
+def run(origin, dest, n_workers, copy_schema, copy_data, copy_constraints, copy_indexes, chunk_size,
+        subset=None, subset_pct=None, subset_children=False, max_worker_memory=None,
+        max_tasks_per_child=None, replicas=None, max_replica_lag=None, range_size=None,
+        snapshot=False, split_lobs=False, lob_chunk_size=100, adaptive=False, min_workers=1,
+        read_latency_slo=None, commit_latency_slo=None, optimize=False, sqlite_page_size=None,
+        profile=None, chunking='pk', reject_dir=None, accept_rejects=False):
+    origins = [origin] + (replicas or [])
+    migrator = DbMigrator(origins, dest, n_workers=int(n_workers),
+                          max_replica_lag=float(max_replica_lag) if max_replica_lag else None,
+                          chunking=chunking, reject_dir=reject_dir, accept_rejects=accept_rejects)
+    if subset:
+        roots = dict((root.split(':', 1) + [None])[:2] for root in subset)
+        migrator.migrate_subset(roots, sample_pct=float(subset_pct) if subset_pct else None,
+                                include_children=subset_children, copy_schema=copy_schema,
+                                copy_constraints=copy_constraints, copy_indexes=copy_indexes,
+                                chunk_size=int(chunk_size), snapshot=snapshot)
+    else:
+        migrator.migrate(copy_schema=copy_schema, copy_data=copy_data,
+                         copy_constraints=copy_constraints, copy_indexes=copy_indexes, chunk_size=int(chunk_size),
+                         max_worker_memory=int(max_worker_memory) if max_worker_memory else None,
+                         max_tasks_per_child=int(max_tasks_per_child) if max_tasks_per_child else None,
+                         range_size=int(range_size) if range_size else None, snapshot=snapshot,
+                         split_lobs=split_lobs, lob_chunk_size=int(lob_chunk_size),
+                         adaptive_concurrency=adaptive, min_workers=int(min_workers),
+                         read_latency_slo=float(read_latency_slo) if read_latency_slo else None,
+                         commit_latency_slo=float(commit_latency_slo) if commit_latency_slo else None,
+                         optimize=optimize,
+                         sqlite_page_size=int(sqlite_page_size) if sqlite_page_size else None,
+                         profile=profile)
+
+
+def distributed_main(command, args):
+    parser = argparse.ArgumentParser(
+        prog=f'cbl-migrator {command}',
+        description='Distributed migration through a lease table: publish the work units, '
+                    'run any number of workers on any host, follow the progress and finalize')
+    if command != 'progress':
+        parser.add_argument('origin',
+                            help='Origin database connection string')
+        parser.add_argument('dest',
+                            help='Destination database connection string')
+    parser.add_argument('--lease',
+                        help='Connection string of the DB holding the lease table, '
+                             'the destination by default',
+                        default=None)
+    parser.add_argument('--replica',
+                        help='Read replica of the origin to spread the reads across. Can be repeated',
+                        action='append',
+                        default=None)
+    parser.add_argument('--range_size',
+                        help='Rows per PK-range work unit',
+                        default=100000)
+    parser.add_argument('--chunk_size',
+                        help='Number of rows copied at the same time',
+                        default=1000)
+    parser.add_argument('--lease_seconds',
+                        help='Seconds before the unit of a silent worker can be taken over',
+                        default=60)
+    parser.add_argument('--accept_rejects',
+                        help='Quarantine the rows refused by the destination in the lease DB and '
+                             'count them as migrated, instead of failing their unit',
+                        action='store_true')
+    # One file per worker process, several workers can run on the same host
+    add_logging_arguments(parser, f'cbl_migrator_worker_{os.getpid()}.log'
+                          if command == 'worker' else 'cbl_migrator.log')
+    args = parser.parse_args(args)
+    setup_logging(args)
+
+    if command == 'progress':
+        if not args.lease:
+            parser.error('--lease is required')
+        print(json.dumps(LeaseTable(args.lease).progress(), indent=2))
+        return
+    lease = args.lease or args.dest
+    reject_dir = lease if args.accept_rejects else None
+    if command == 'worker':
+        run_worker(lease, [args.origin] + (args.replica or []), args.dest, chunk_size=int(args.chunk_size),
+                   lease_seconds=float(args.lease_seconds), reject_dir=reject_dir)
+        return
+    migrator = DbMigrator(args.origin, args.dest, reject_dir=reject_dir,
+                          accept_rejects=args.accept_rejects)
+    if command == 'publish':
+        migrator.publish_units(lease, range_size=int(args.range_size))
+    else:
+        migrator.finalize_units(lease)
 
 
 def main(args=None):
     if args is None:
         args = sys.argv[1:]
+    if args and args[0] in DISTRIBUTED_COMMANDS:
+        return distributed_main(args[0], args[1:])
 
     parser = argparse.ArgumentParser(
         description='Migrate an Oracle database to a PosgreSQL, MySQL or SQLite server')
@@ -46,9 +154,118 @@ def main(args=None):
                         help='Number of rows copied at the same time',
                         default=1000)
 
+    parser.add_argument('--subset',
+                        help='Only copy the rows of this root table and the rows they reference, '
+                             'as table or table:predicate. Can be repeated',
+                        action='append',
+                        default=None)
+
+    parser.add_argument('--subset_pct',
+                        help='Percentage of the subset root rows to copy',
+                        default=None)
+
+    parser.add_argument('--subset_children',
+                        help='Also copy the rows referencing the subset roots',
+                        action='store_true')
+
+    parser.add_argument('--max_worker_memory',
+                        help='Worker RSS cap in MB, workers above it are recycled',
+                        default=None)
+
+    parser.add_argument('--max_tasks_per_child',
+                        help='Recycle workers after this many tables each',
+                        default=None)
+
+    parser.add_argument('--replica',
+                        help='Read replica of the origin to spread the reads across. Can be repeated',
+                        action='append',
+                        default=None)
+
+    parser.add_argument('--max_replica_lag',
+                        help='Stop reading from replicas lagging more than these seconds',
+                        default=None)
+
+    parser.add_argument('--range_size',
+                        help='Split tables into PK-range jobs of this many rows',
+                        default=None)
+
+    parser.add_argument('--snapshot',
+                        help='Read the whole origin at a single point in time (Oracle SCN, '
+                             'PostgreSQL exported snapshot)',
+                        action='store_true')
+
+    parser.add_argument('--split_lobs',
+                        help='Copy LOB columns in a second pass, after the narrow columns',
+                        action='store_true')
+
+    parser.add_argument('--lob_chunk_size',
+                        help='Number of rows copied at the same time by the LOB pass',
+                        default=100)
+
+    parser.add_argument('--adaptive',
+                        help='Adjust the jobs copied at the same time between --min_workers and '
+                             '--n_workers to the origin and destination latencies',
+                        action='store_true')
+
+    parser.add_argument('--min_workers',
+                        help='Lower bound of the adaptive concurrency',
+                        default=1)
+
+    parser.add_argument('--read_latency_slo',
+                        help='Chunk read latency in seconds above which the adaptive concurrency '
+                             'backs off, twice the best one by default',
+                        default=None)
+
+    parser.add_argument('--commit_latency_slo',
+                        help='Chunk commit latency in seconds above which the adaptive concurrency '
+                             'backs off, twice the best one by default',
+                        default=None)
+
+    parser.add_argument('--optimize',
+                        help='Gather statistics and vacuum the destination tables once migrated',
+                        action='store_true')
+
+    parser.add_argument('--sqlite_page_size',
+                        help='Page size of a SQLite destination, set when it is vacuumed',
+                        default=None)
+
+    parser.add_argument('--profile',
+                        help='Profile every table copy and write a merged hotspot report to this '
+                             'directory (cbl_migrator_profile by default)',
+                        nargs='?',
+                        const='cbl_migrator_profile',
+                        default=None)
+
+    parser.add_argument('--chunking',
+                        help='Read tables by PK order (pk), or by physical row location ranges '
+                             'including tables without PK (physical)',
+                        choices=['pk', 'physical'],
+                        default='pk')
+
+    parser.add_argument('--reject_dir',
+                        help='Quarantine the rows refused by the destination to this directory, or '
+                             'DB connection string, instead of failing their table. Validation '
+                             'still fails on them without --accept_rejects',
+                        default=None)
+
+    parser.add_argument('--accept_rejects',
+                        help='Count the quarantined rows as migrated, in cbl_migrator_rejects '
+                             'unless --reject_dir is given',
+                        action='store_true')
+
+    add_logging_arguments(parser, 'cbl_migrator.log')
+
     args = parser.parse_args()
+    setup_logging(args)
     run(args.origin, args.dest, args.n_workers, args.copy_schema,
-        args.copy_data, args.copy_constraints, args.copy_indexes, args.chunk_size)
+        args.copy_data, args.copy_constraints, args.copy_indexes, args.chunk_size,
+        args.subset, args.subset_pct, args.subset_children, args.max_worker_memory,
+        args.max_tasks_per_child, args.replica, args.max_replica_lag, args.range_size,
+        args.snapshot, args.split_lobs, args.lob_chunk_size, args.adaptive, args.min_workers,
+        args.read_latency_slo, args.commit_latency_slo, args.optimize, args.sqlite_page_size,
+        args.profile, args.chunking,
+        args.reject_dir or ('cbl_migrator_rejects' if args.accept_rejects else None),
+        args.accept_rejects)
 
 
 if __name__ == '__main__':
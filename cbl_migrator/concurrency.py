@@ -0,0 +1,183 @@
+from .logs import logger
+
+
+class ConcurrencyController:
+    """
+    AIMD controller of the number of jobs copied at the same time.
+
+    After each job it looks at the chunk read latency on the origin, the
+    commit latency on the destination and the error rate (transient errors
+    retried and failed jobs over chunks read). The limit grows by one while
+    they are within their SLOs and is halved when one of them is not, at
+    most once per window of limit jobs so a single slow spell is not
+    punished several times.
+
+    Without explicit SLOs each job is compared with the best latency seen
+    on its own table, chunks of wide tables being slower than those of
+    narrow ones: the SLO is breached when the EWMA of these ratios is above
+    slow_factor. Until its table has MIN_SAMPLES jobs, as when each table is
+    a single job, a job is compared with the best latency per chunk value
+    (rows times columns) of all tables instead.
+
+    Attributes:
+        limit (int): Jobs allowed to run at the same time.
+        read_latency (float): EWMA of the chunk read latency, seconds.
+        commit_latency (float): EWMA of the chunk commit latency, seconds.
+        read_slowdown (float): EWMA of the read latency over the best one
+            of the same table, or per chunk value.
+        commit_slowdown (float): EWMA of the commit latency over the best
+            one of the same table, or per chunk value.
+        error_rate (float): EWMA of the error rate.
+    """
+
+    # EWMA weight of new samples
+    ALPHA = 0.3
+    # Factor applied to the limit on a decrease
+    BETA = 0.5
+    # Jobs of a table before its own best latency is its baseline
+    MIN_SAMPLES = 3
+
+    def __init__(
+        self,
+        max_workers,
+        min_workers=1,
+        initial=None,
+        read_latency_slo=None,
+        commit_latency_slo=None,
+        max_error_rate=0.05,
+        slow_factor=2.0,
+    ):
+        self.max_workers = max_workers
+        self.min_workers = max(1, min(min_workers, max_workers))
+        self.limit = min(
+            max(initial or self.min_workers, self.min_workers), max_workers
+        )
+        self.read_latency_slo = read_latency_slo
+        self.commit_latency_slo = commit_latency_slo
+        self.max_error_rate = max_error_rate
+        self.slow_factor = slow_factor
+        self.read_latency = None
+        self.commit_latency = None
+        self.read_slowdown = None
+        self.commit_slowdown = None
+        self.error_rate = 0.0
+        # Best latencies per table, and per chunk value of all tables
+        self.best_read = {}
+        self.best_commit = {}
+        self.best_per_value = {"read": None, "commit": None}
+        self.samples = {}
+        self.since_decrease = 0
+        logger.info(
+            f"Adaptive concurrency between {self.min_workers} and {max_workers} "
+            f"jobs, starting at {self.limit}"
+        )
+
+    def __ewma(self, prev, value):
+        if value is None:
+            return prev
+        if prev is None:
+            return value
+        return self.ALPHA * value + (1 - self.ALPHA) * prev
+
+    def __slowdown(self, prev, name, best, table, latency, values):
+        """
+        EWMA of prev updated with latency over the best one of its table,
+        or over the best one per chunk value while the table has few jobs.
+        """
+        if latency is None:
+            return prev
+        best[table] = min(best.get(table, latency), latency)
+        if not values or self.samples.get(table, 0) >= self.MIN_SAMPLES:
+            return self.__ewma(prev, latency / best[table] if best[table] else 1.0)
+        per_value = latency / values
+        best_per_value = min(self.best_per_value[name] or per_value, per_value)
+        self.best_per_value[name] = best_per_value
+        return self.__ewma(prev, per_value / best_per_value if best_per_value else 1.0)
+
+    def done(
+        self,
+        read_latency=None,
+        commit_latency=None,
+        chunks=0,
+        errors=0,
+        table=None,
+        values=None,
+    ):
+        """
+        Records a finished job: its mean chunk read and commit latencies,
+        the chunks it read, the transient errors it retried, the table it
+        copied, whose best latencies it is compared with, and the mean
+        values of its chunks.
+        """
+        self.read_latency = self.__ewma(self.read_latency, read_latency)
+        self.commit_latency = self.__ewma(self.commit_latency, commit_latency)
+        self.read_slowdown = self.__slowdown(
+            self.read_slowdown, "read", self.best_read, table, read_latency, values
+        )
+        self.commit_slowdown = self.__slowdown(
+            self.commit_slowdown,
+            "commit",
+            self.best_commit,
+            table,
+            commit_latency,
+            values,
+        )
+        self.samples[table] = self.samples.get(table, 0) + 1
+        if chunks or errors:
+            self.error_rate = self.__ewma(self.error_rate, errors / (chunks + errors))
+        self.__adjust()
+
+    def failed(self):
+        """
+        Records a failed job.
+        """
+        self.error_rate = self.__ewma(self.error_rate, 1.0)
+        self.__adjust()
+
+    def __breached(self):
+        """
+        Why the origin or destination is overloaded, None if it's not.
+        """
+        for name, latency, slo, slowdown in (
+            ("read", self.read_latency, self.read_latency_slo, self.read_slowdown),
+            (
+                "commit",
+                self.commit_latency,
+                self.commit_latency_slo,
+                self.commit_slowdown,
+            ),
+        ):
+            if slo:
+                if latency and latency > slo:
+                    return f"{name} latency {latency:.3f}s above {slo:.3f}s"
+            elif slowdown and slowdown > self.slow_factor:
+                return (
+                    f"{name} latency {slowdown:.1f}x the best of the same "
+                    f"tables or chunk values, above {self.slow_factor:.1f}x"
+                )
+        if self.error_rate > self.max_error_rate:
+            return f"error rate {self.error_rate:.1%} above {self.max_error_rate:.1%}"
+        return None
+
+    def __adjust(self):
+        self.since_decrease += 1
+        reason = self.__breached()
+        if reason:
+            if self.since_decrease < self.limit:
+                return
+            new_limit = max(self.min_workers, int(self.limit * self.BETA))
+            self.since_decrease = 0
+        else:
+            new_limit = min(self.max_workers, self.limit + 1)
+            reason = "within SLOs"
+        if new_limit != self.limit:
+            logger.info(
+                f"Concurrency {self.limit} -> {new_limit}: {reason} "
+                f"(read {_fmt(self.read_latency)}, commit "
+                f"{_fmt(self.commit_latency)}, errors {self.error_rate:.1%})"
+            )
+            self.limit = new_limit
+
+
+def _fmt(latency):
+    return "n/a" if latency is None else f"{latency:.3f}s"
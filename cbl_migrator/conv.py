@@ -1,15 +1,33 @@
-from sqlalchemy.types import Numeric, Text, String, BigInteger, SmallInteger, Integer
-from sqlalchemy.dialects.oracle import CLOB as ora_clob
-from sqlalchemy.dialects.mysql import (
-    TINYINT as mysql_TINYINT,
-    SMALLINT as mysql_SMALLINT,
-    MEDIUMINT as mysql_MEDIUMINT,
-    INTEGER as mysql_INTEGER,
-    BIGINT as mysql_BIGINT,
-    LONGTEXT as mysql_LONGTEXT,
+from decimal import Decimal
+from functools import lru_cache
+from importlib import metadata
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.types import (
+    Numeric,
+    Float,
+    Text,
+    String,
+    LargeBinary,
+    BigInteger,
+    SmallInteger,
+    Integer,
 )
+from .logs import logger
 
+# Rows per round trip when fetching LOB locators, and characters/bytes
+# read per piece from each locator
+LOB_ARRAYSIZE = 100
+LOB_PIECE_SIZE = 1024 * 1024
 
+# Entry point group of third party converters. Entry point names are
+# "<origin dialect>.<destination dialect>", e.g.:
+#   [project.entry-points."cbl_migrator.converters"]
+#   "postgresql.sqlite" = "my_package.conv:pg2sqlite"
+ENTRY_POINT_GROUP = "cbl_migrator.converters"
+
+# Built-in converters, dialect specific types are only imported when a
+# converter needing them is called.
 COLTYPE_CONV = {}
 
 
@@ -17,6 +35,15 @@ def ora2mysql(col):
     """
     Used in ChEMBL dump generation
     """
+    from sqlalchemy.dialects.mysql import (
+        TINYINT as mysql_TINYINT,
+        SMALLINT as mysql_SMALLINT,
+        MEDIUMINT as mysql_MEDIUMINT,
+        INTEGER as mysql_INTEGER,
+        BIGINT as mysql_BIGINT,
+        LONGTEXT as mysql_LONGTEXT,
+    )
+
     if isinstance(col.type, Numeric):
         if col.type.scale == 0:
             if col.type.precision == 1:
@@ -95,6 +122,8 @@ def mysql2ora(col):
     """
     Not much tested
     """
+    from sqlalchemy.dialects.oracle import CLOB as ora_clob
+
     if isinstance(col.type, String):
         if not col.type.length:
             col.type = col.type.adapt(ora_clob)
@@ -111,3 +140,191 @@ COLTYPE_CONV["oracle"] = {
 }
 COLTYPE_CONV["sqlite"] = {"oracle": sqlite2ora, "sqlite": sqlite2sqlite}
 COLTYPE_CONV["postgresql"] = {"oracle": pg2ora}
+
+_entry_points_loaded = False
+
+
+def register_converter(o_dialect, d_dialect, func):
+    """
+    Registers the column converter of an origin/destination dialect pair,
+    replacing the existing one if any.
+
+    Args:
+        o_dialect (str): Origin dialect name, e.g. 'postgresql'.
+        d_dialect (str): Destination dialect name, e.g. 'sqlite'.
+        func (callable): Takes a reflected column and returns it adapted
+            to the destination.
+    """
+    COLTYPE_CONV.setdefault(o_dialect, {})[d_dialect] = func
+
+
+def _load_entry_points():
+    """
+    Registers the converters published under ENTRY_POINT_GROUP, once.
+    Entry points are only loaded for a pair that is not built in.
+    """
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    eps = metadata.entry_points()
+    if hasattr(eps, "select"):
+        eps = eps.select(group=ENTRY_POINT_GROUP)
+    else:
+        eps = eps.get(ENTRY_POINT_GROUP, [])
+    for ep in eps:
+        try:
+            o_dialect, d_dialect = ep.name.split(".")
+            register_converter(o_dialect, d_dialect, ep.load())
+        except Exception as e:
+            logger.warning(f"Can't load converter '{ep.name}' ({ep.value}): {e}")
+
+
+def get_converter(o_dialect, d_dialect):
+    """
+    Column converter from an origin to a destination dialect, looking at
+    the registered entry points when the pair is not built in.
+    """
+    if d_dialect not in COLTYPE_CONV.get(o_dialect, {}):
+        _load_entry_points()
+    try:
+        return COLTYPE_CONV[o_dialect][d_dialect]
+    except KeyError:
+        raise Exception(f"Migration from {o_dialect} to {d_dialect} not available")
+
+
+@lru_cache(maxsize=None)
+def generic_type(cls):
+    """
+    Generic SQLAlchemy type class of a reflected, dialect specific, type
+    class: the first non uppercase, non private class in its MRO. Cached,
+    as all the columns of a schema share a handful of type classes.
+    """
+    for supercls in cls.__mro__:
+        if hasattr(supercls, "__visit_name__"):
+            cls = supercls
+        if (
+            supercls.__name__ != supercls.__name__.upper()
+            and not supercls.__name__.startswith("_")
+        ):
+            break
+    return cls
+
+
+def _to_int(value):
+    return None if value is None else int(value)
+
+
+def _to_float(value):
+    return None if value is None else float(value)
+
+
+def _read_lob(value):
+    if value is None or isinstance(value, (str, bytes)):
+        return value
+    if hasattr(value, "size"):
+        # Oracle LOB locator, read piecewise (offsets start at 1)
+        size = value.size()
+        pieces = [
+            value.read(offset, LOB_PIECE_SIZE)
+            for offset in range(1, size + 1, LOB_PIECE_SIZE)
+        ]
+        return pieces[0][:0].join(pieces) if pieces else value.read()
+    return value.read()
+
+
+def _is_decimal(value):
+    return isinstance(value, Decimal)
+
+
+def _is_lob(value):
+    return hasattr(value, "read")
+
+
+def _value_converter(coltype):
+    """
+    Python-side converter matching the destination type set by COLTYPE_CONV.
+    """
+    if isinstance(coltype, Integer):
+        return _to_int, _is_decimal
+    if isinstance(coltype, Float):
+        return _to_float, _is_decimal
+    if isinstance(coltype, Numeric) and not coltype.asdecimal:
+        return _to_float, _is_decimal
+    if isinstance(coltype, (Text, LargeBinary)):
+        return _read_lob, _is_lob
+    return None, None
+
+
+def compile_value_converter(table):
+    """
+    Compiles a converter for the rows of a destination table.
+
+    The returned callable takes the result keys and a chunk of rows and
+    returns the list of parameter dicts to insert. Conversion is done column
+    by column over the whole chunk, and only for columns whose first non null
+    value still comes as a driver type (Decimal, LOB locator).
+    """
+    converters = {}
+    for col in table.columns:
+        func, needed = _value_converter(col.type)
+        if func is not None:
+            converters[col.name] = (func, needed)
+
+    def convert(keys, rows):
+        if not rows:
+            return []
+        todo = [
+            (idx, converters[key]) for idx, key in enumerate(keys) if key in converters
+        ]
+        if not todo:
+            return [dict(zip(keys, row)) for row in rows]
+        columns = list(zip(*rows))
+        for idx, (func, needed) in todo:
+            values = columns[idx]
+            sample = next((v for v in values if v is not None), None)
+            if sample is None or not needed(sample):
+                continue
+            columns[idx] = list(map(func, values))
+        return [dict(zip(keys, row)) for row in zip(*columns)]
+
+    return convert
+
+
+def lob_engine_options(conn_string):
+    """
+    create_engine options of an origin read by the LOB pass: LOB_ARRAYSIZE
+    rows per round trip, and LOBs kept as locators by the Oracle dialect.
+    """
+    if make_url(conn_string).get_backend_name() == "oracle":
+        return {"arraysize": LOB_ARRAYSIZE, "auto_convert_lobs": False}
+    return {}
+
+
+def set_output_type_handler(eng):
+    """
+    Makes the Oracle driver return NUMBER(p, 0) values as int instead of
+    Decimal, also in results whose columns SQLAlchemy doesn't type as
+    Integer, where the dialect's own cursor handler already does it.
+    Everything else, LOBs included, is left to the dialect handler: LOBs come
+    inline as str/bytes with auto_convert_lobs, and as locators for the LOB
+    pass, see lob_engine_options.
+    Other dialects already return native Python types.
+    """
+    if eng.name != "oracle":
+        return
+
+    @event.listens_for(eng, "connect")
+    def connect(dbapi_conn, conn_record):
+        dbapi = eng.dialect.dbapi
+        default_handler = dbapi_conn.outputtypehandler
+
+        def output_type_handler(cursor, name, default_type, size, precision, scale):
+            if default_type is dbapi.DB_TYPE_NUMBER and scale == 0 and precision:
+                return cursor.var(int, arraysize=cursor.arraysize)
+            if default_handler is not None:
+                return default_handler(
+                    cursor, name, default_type, size, precision, scale
+                )
+
+        dbapi_conn.outputtypehandler = output_type_handler
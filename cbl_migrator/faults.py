@@ -0,0 +1,297 @@
+from sqlalchemy import Column, MetaData, Table, create_engine, event, select
+from sqlalchemy.exc import DBAPIError, DisconnectionError
+from sqlalchemy.types import String, Text
+import json
+import os
+import time
+from .logs import logger
+
+# Attempts for a chunk hitting transient errors, and first backoff in seconds
+RETRIES = 4
+BACKOFF = 1.0
+
+# Transient errors retried by the current worker task
+TRANSIENT_ERRORS = []
+
+# Table of the rejects kept in a DB instead of a directory
+REJECTS_TABLE = "cbl_migrator_rejects"
+
+# Driver error codes of transient conditions on live connections, by
+# driver module: deadlocks, lock and statement timeouts, serialization
+# failures, overload
+TRANSIENT_CODES = {
+    # SQLSTATE
+    ("psycopg",): {"40001", "40P01", "55P03", "57014", "53000", "53300"},
+    # Server and client error numbers
+    ("MySQLdb", "pymysql", "mysql"): {1040, 1205, 1213, 2006, 2013},
+    # ORA- numbers
+    ("oracledb", "cx_Oracle"): {54, 60, 4021, 4068, 8176, 30006},
+}
+
+# Messages of SQLITE_BUSY and SQLITE_LOCKED
+SQLITE_TRANSIENT = ("database is locked", "database table is locked")
+
+
+def _error_code(orig):
+    """
+    Driver error code of a DBAPI exception: SQLSTATE for psycopg, the
+    error number for MySQL drivers and Oracle, None if there is none.
+    """
+    code = getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+    if code is None:
+        code = getattr(orig, "errno", None)
+    if code is None and getattr(orig, "args", None):
+        # Oracle drivers wrap an error object with the code
+        code = getattr(orig.args[0], "code", orig.args[0])
+    return code
+
+
+class CopyAborted(Exception):
+    """
+    Raised by the copy loops once their abort callable is true, like when
+    the worker lost the lease of the unit it was copying.
+    """
+
+
+def is_transient(exc):
+    """
+    Whether an error is worth retrying on a fresh connection rather than
+    bisecting: dropped connections, as detected by the dialect, and the
+    driver codes of deadlocks, lock timeouts and the like. Other errors,
+    like SQL errors or constraint violations, fail the same way again.
+    """
+    if isinstance(exc, DisconnectionError):
+        return True
+    if not isinstance(exc, DBAPIError):
+        return False
+    if exc.connection_invalidated:
+        return True
+    module = type(exc.orig).__module__
+    for drivers, codes in TRANSIENT_CODES.items():
+        if module.startswith(drivers):
+            return _error_code(exc.orig) in codes
+    return str(exc.orig).startswith(SQLITE_TRANSIENT)
+
+
+def with_retries(func, eng, retries=RETRIES, backoff=BACKOFF):
+    """
+    Calls func, retrying with exponential backoff on transient errors.
+    The engine pool is disposed before each retry so it runs on a
+    fresh connection.
+    """
+    for attempt in range(retries):
+        try:
+            return func()
+        except Exception as e:
+            if not is_transient(e) or attempt == retries - 1:
+                raise
+            wait = backoff * 2**attempt
+            TRANSIENT_ERRORS.append(type(e).__name__)
+            logger.warning(f"Transient error, retrying in {wait:.1f}s: {e}")
+            eng.dispose()
+            time.sleep(wait)
+
+
+class RejectSink:
+    """
+    Quarantines rows the destination refuses to a JSON lines file,
+    one per table, so the rest of the table can keep streaming.
+
+    reject_dir can also be the connection string of a DB, like the lease DB
+    of a distributed migration, where rejects are kept in a REJECTS_TABLE
+    table seen by the workers of every host.
+
+    Rows are identified by their PK, or all their values for tables
+    without PK, a row rejected again when resuming a migration is not
+    written twice.
+
+    Attributes:
+        path (str): Reject file of the table, or the reject table.
+        pks (set): PKs of the rejected rows.
+    """
+
+    def __init__(self, reject_dir, table):
+        self.reject_dir = reject_dir
+        self.table_name = table.name
+        if _is_db(reject_dir):
+            self.path = f"{REJECTS_TABLE} table"
+        else:
+            self.path = os.path.join(reject_dir, f"{table.name}.jsonl")
+        self.pk_names = [c.name for c in table.primary_key.columns] or [
+            c.name for c in table.columns
+        ]
+        self.pks = {tuple(rec["pk"]) for rec in read_rejects(reject_dir, table.name)}
+
+    def add(self, row, error):
+        pk = [row.get(name) for name in self.pk_names]
+        key = tuple(json.loads(json.dumps(pk, default=str)))
+        if key in self.pks:
+            return
+        self.pks.add(key)
+        error = str(error).splitlines()[0]
+        if _is_db(self.reject_dir):
+            eng, rejects = _rejects_table(self.reject_dir)
+            with eng.begin() as conn:
+                conn.execute(
+                    rejects.insert(),
+                    {
+                        "table_name": self.table_name,
+                        "pk": json.dumps(pk, default=str),
+                        "row": json.dumps(row, default=str),
+                        "error": error,
+                    },
+                )
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a") as f:
+            rec = {"pk": pk, "row": row, "error": error}
+            f.write(json.dumps(rec, default=str) + "\n")
+
+    def __len__(self):
+        return len(self.pks)
+
+
+def _is_db(reject_dir):
+    return "://" in reject_dir
+
+
+def _rejects_table(conn_string):
+    """
+    Engine of a DB keeping rejects and its REJECTS_TABLE table.
+    """
+    eng = create_engine(conn_string)
+    rejects = Table(
+        REJECTS_TABLE,
+        MetaData(),
+        Column("table_name", String(128), nullable=False, index=True),
+        # JSON encoded PK and row
+        Column("pk", Text, nullable=False),
+        Column("row", Text),
+        Column("error", Text),
+    )
+    rejects.metadata.create_all(eng)
+    return eng, rejects
+
+
+def read_rejects(reject_dir, table_name):
+    """
+    Rejected rows of a table, as dicts with pk, row and error keys.
+    """
+    if _is_db(reject_dir):
+        eng, rejects = _rejects_table(reject_dir)
+        with eng.connect() as conn:
+            res = conn.execute(
+                select(rejects.c.pk, rejects.c.row, rejects.c.error).where(
+                    rejects.c.table_name == table_name
+                )
+            )
+            return [
+                {"pk": json.loads(pk), "row": json.loads(row), "error": error}
+                for pk, row, error in res
+            ]
+    path = os.path.join(reject_dir, f"{table_name}.jsonl")
+    if not os.path.isfile(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def clear_rejects(reject_dir, table_name):
+    """
+    Removes the rows of a table quarantined in reject_dir.
+
+    Returns:
+        int: Number of distinct rows removed.
+    """
+    n_rejects = count_rejects(reject_dir, table_name)
+    if n_rejects and _is_db(reject_dir):
+        eng, rejects = _rejects_table(reject_dir)
+        with eng.begin() as conn:
+            conn.execute(rejects.delete().where(rejects.c.table_name == table_name))
+    elif n_rejects:
+        os.remove(os.path.join(reject_dir, f"{table_name}.jsonl"))
+    return n_rejects
+
+
+def count_rejects(reject_dir, table_name):
+    """
+    Number of distinct rows of a table quarantined in reject_dir.
+    """
+    if not reject_dir:
+        return 0
+    return len({tuple(rec["pk"]) for rec in read_rejects(reject_dir, table_name)})
+
+
+def sqlite_savepoints(eng):
+    """
+    Makes pysqlite emit BEGIN for the transactions of an engine, so
+    SAVEPOINTs nest in them. Otherwise pysqlite only begins on DML and
+    releasing the savepoint of insert_rows commits it.
+    """
+
+    @event.listens_for(eng, "connect")
+    def connect(dbapi_conn, conn_record):
+        dbapi_conn.isolation_level = None
+
+    @event.listens_for(eng, "begin")
+    def begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+
+def _pk_exists(d_eng, table, row, conn=None):
+    """
+    Whether the destination already has a row with the PK of row.
+    """
+    pks = list(table.primary_key.columns)
+    if not pks:
+        return False
+    q = select(*pks).where(*[c == row.get(c.name) for c in pks]).limit(1)
+    if conn is not None:
+        return conn.execute(q).first() is not None
+    with d_eng.connect() as d_conn:
+        return d_conn.execute(q).first() is not None
+
+
+def insert_rows(d_eng, table, rows, rejects=None, conn=None):
+    """
+    Inserts a chunk of rows in the destination.
+
+    Transient errors are retried on a fresh connection. Other errors bisect
+    the chunk until the rows causing them are isolated and sent to rejects.
+    Without rejects errors are raised as they are, and so are the errors of
+    rows whose PK is already in the destination, copied twice rather than
+    refused.
+
+    With conn, rows are inserted in a savepoint of its transaction and
+    transient errors are left to the caller, which owns the transaction.
+    SQLite engines need sqlite_savepoints for that.
+    """
+
+    def insert():
+        if conn is not None:
+            with conn.begin_nested():
+                conn.execute(table.insert(), rows)
+            return
+        with d_eng.begin() as d_conn:
+            d_conn.execute(table.insert(), rows)
+
+    try:
+        if conn is not None:
+            insert()
+        else:
+            with_retries(insert, d_eng)
+    except Exception as e:
+        if rejects is None or is_transient(e):
+            raise
+        if len(rows) == 1:
+            if _pk_exists(d_eng, table, rows[0], conn):
+                raise
+            logger.warning(
+                f"Row rejected by the destination in '{table.name}', "
+                f"quarantined to {rejects.path}: {str(e).splitlines()[0]}"
+            )
+            rejects.add(rows[0], e)
+            return
+        mid = len(rows) // 2
+        insert_rows(d_eng, table, rows[:mid], rejects, conn)
+        insert_rows(d_eng, table, rows[mid:], rejects, conn)
@@ -0,0 +1,243 @@
+from sqlalchemy import (
+    Column,
+    MetaData,
+    Table,
+    and_,
+    create_engine,
+    func,
+    or_,
+    select,
+)
+from sqlalchemy.types import BigInteger, Float, Integer, String, Text
+import json
+import time
+from .faults import with_retries
+from .logs import logger
+
+LEASE_TABLE = "cbl_migrator_lease"
+
+
+class LeaseTable:
+    """
+    Control table holding the work units of a distributed migration.
+
+    A coordinator publishes one row per table/PK range, and any number of
+    workers, on any host, claim pending units (or units whose lease
+    expired), heartbeat while copying them and mark them done. It can live
+    in the destination DB or in a shared SQLite file.
+
+    Attributes:
+        eng: Engine of the DB holding the lease table.
+        table (Table): The lease table.
+        lease_seconds (float): Time a claimed unit stays owned without heartbeat.
+        max_attempts (int): Failed attempts before a unit is given up.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, conn_string, lease_seconds=60, max_attempts=3):
+        self.eng = create_engine(conn_string)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.table = Table(
+            LEASE_TABLE,
+            MetaData(),
+            Column("unit_id", Integer, primary_key=True, autoincrement=False),
+            Column("table_name", String(128), nullable=False),
+            # PK range bounds, JSON encoded, null for open ends
+            Column("lo", String(4000)),
+            Column("hi", String(4000)),
+            Column("status", String(16), nullable=False),
+            Column("owner", String(255)),
+            Column("expires", Float),
+            Column("rows", BigInteger),
+            Column("attempts", Integer, nullable=False),
+            Column("error", Text),
+        )
+        self.table.metadata.create_all(self.eng)
+
+    def publish(self, units):
+        """
+        Publishes the work units, a list of (table_name, lo, hi) tuples.
+        Units already published by a previous run are kept so the
+        migration can be resumed.
+        """
+        with self.eng.begin() as conn:
+            n_units = conn.execute(
+                select(func.count()).select_from(self.table)
+            ).scalar()
+            if n_units:
+                logger.info(f"{n_units} work units already published, resuming")
+                return
+            conn.execute(
+                self.table.insert(),
+                [
+                    {
+                        "unit_id": unit_id,
+                        "table_name": table_name,
+                        "lo": None if lo is None else json.dumps(lo),
+                        "hi": None if hi is None else json.dumps(hi),
+                        "status": self.PENDING,
+                        "attempts": 0,
+                    }
+                    for unit_id, (table_name, lo, hi) in enumerate(units)
+                ],
+            )
+        logger.info(f"Published {len(units)} work units")
+
+    def __claimable(self, now):
+        t = self.table
+        return or_(
+            t.c.status == self.PENDING,
+            and_(t.c.status == self.RUNNING, t.c.expires < now),
+        )
+
+    def claim(self, owner):
+        """
+        Claims the first unit that is pending or whose lease expired.
+
+        Returns:
+            tuple | None: (unit_id, table_name, lo, hi), None if nothing
+            can be claimed right now.
+        """
+        t = self.table
+
+        def try_claim():
+            now = time.time()
+            with self.eng.begin() as conn:
+                row = conn.execute(
+                    select(t.c.unit_id, t.c.table_name, t.c.lo, t.c.hi, t.c.owner)
+                    .where(self.__claimable(now))
+                    .order_by(t.c.unit_id)
+                    .limit(1)
+                ).first()
+                if row is None:
+                    return None, None
+                # Only one worker wins the conditional update
+                res = conn.execute(
+                    t.update()
+                    .where(and_(t.c.unit_id == row.unit_id, self.__claimable(now)))
+                    .values(
+                        status=self.RUNNING,
+                        owner=owner,
+                        expires=now + self.lease_seconds,
+                    )
+                )
+            return row, res.rowcount == 1
+
+        while True:
+            row, claimed = with_retries(try_claim, self.eng)
+            if row is None:
+                return None
+            if claimed:
+                if row.owner:
+                    logger.warning(
+                        f"Took over expired unit {row.unit_id} of '{row.table_name}' "
+                        f"from {row.owner}"
+                    )
+                return (
+                    row.unit_id,
+                    row.table_name,
+                    None if row.lo is None else json.loads(row.lo),
+                    None if row.hi is None else json.loads(row.hi),
+                )
+
+    def __update(self, unit_id, owner, values):
+        t = self.table
+
+        def update():
+            with self.eng.begin() as conn:
+                res = conn.execute(
+                    t.update()
+                    .where(
+                        and_(
+                            t.c.unit_id == unit_id,
+                            t.c.owner == owner,
+                            t.c.status == self.RUNNING,
+                        )
+                    )
+                    .values(**values)
+                )
+            return res.rowcount == 1
+
+        return with_retries(update, self.eng)
+
+    def heartbeat(self, unit_id, owner):
+        """
+        Extends the lease of a claimed unit. Returns False if it was lost.
+        """
+        return self.__update(
+            unit_id, owner, {"expires": time.time() + self.lease_seconds}
+        )
+
+    def complete(self, unit_id, owner, rows=None):
+        """
+        Marks a claimed unit as done.
+        """
+        return self.__update(unit_id, owner, {"status": self.DONE, "rows": rows})
+
+    def fail(self, unit_id, owner, error):
+        """
+        Releases a claimed unit after an error, giving it up once it
+        failed max_attempts times.
+        """
+        t = self.table
+        with self.eng.connect() as conn:
+            attempts = conn.execute(
+                select(t.c.attempts).where(t.c.unit_id == unit_id)
+            ).scalar()
+        status = self.FAILED if attempts + 1 >= self.max_attempts else self.PENDING
+        return self.__update(
+            unit_id,
+            owner,
+            {
+                "status": status,
+                "attempts": attempts + 1,
+                "owner": None,
+                "expires": None,
+                "error": str(error),
+            },
+        )
+
+    def progress(self):
+        """
+        Aggregate progress of the migration.
+
+        Returns:
+            dict: Number of units per status, rows copied by the done
+            units, and units still to do per table.
+        """
+        t = self.table
+        with self.eng.connect() as conn:
+            by_status = dict(
+                conn.execute(
+                    select(t.c.status, func.count()).group_by(t.c.status)
+                ).all()
+            )
+            rows = conn.execute(select(func.sum(t.c.rows))).scalar() or 0
+            todo = dict(
+                conn.execute(
+                    select(t.c.table_name, func.count())
+                    .where(t.c.status != self.DONE)
+                    .group_by(t.c.table_name)
+                ).all()
+            )
+        return {
+            "units": sum(by_status.values()),
+            **{
+                s: by_status.get(s, 0)
+                for s in (self.PENDING, self.RUNNING, self.DONE, self.FAILED)
+            },
+            "rows": rows,
+            "tables_todo": todo,
+        }
+
+    def finished(self):
+        """
+        Whether no unit is pending or running anymore.
+        """
+        progress = self.progress()
+        return progress[self.PENDING] == 0 and progress[self.RUNNING] == 0
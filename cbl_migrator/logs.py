@@ -1,48 +1,195 @@
+import atexit
+import json
 import logging
 import logging.handlers
+import multiprocessing
 import os
+import threading
+import time
 
-def setup_logger(name="cbl_migrator", log_file="cbl_migrator.log", level=logging.DEBUG):
-    """Configure and return a logger with both file and console handlers."""
+# Records go through a queue to a single listener in the coordinator, which
+# owns the file and console handlers. Workers only put records in the queue.
+_queue = None
+_listener = None
+_chunk_rate = 1.0
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as JSON lines, with the table and chunk fields
+    given through extra when present.
+    """
+
+    FIELDS = ("table", "chunk", "rows")
+
+    def format(self, record):
+        rec = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "name": record.name,
+            "process": record.process,
+            "file": f"{record.filename}:{record.lineno}",
+            "message": record.getMessage(),
+        }
+        for field in self.FIELDS:
+            if hasattr(record, field):
+                rec[field] = getattr(record, field)
+        if record.exc_text:
+            rec["exc"] = record.exc_text
+        return json.dumps(rec, default=str)
+
+
+class ChunkRateFilter(logging.Filter):
+    """
+    Rate limits per-chunk debug records (those with a chunk field) to
+    rate records per second and table, dropping the rest before they
+    reach the queue. Other records always pass.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+        self.allowance = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or not hasattr(record, "chunk"):
+            return True
+        if not self.rate:
+            return False
+        key = getattr(record, "table", None)
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.allowance.get(key, (self.rate, now))
+            tokens = min(self.rate, tokens + (now - last) * self.rate)
+            keep = tokens >= 1
+            self.allowance[key] = (tokens - 1 if keep else tokens, now)
+        return keep
+
+
+def _queue_handler(queue, chunk_rate):
+    handler = logging.handlers.QueueHandler(queue)
+    handler.addFilter(ChunkRateFilter(chunk_rate))
+    return handler
+
+
+def setup_logger(
+    name="cbl_migrator",
+    log_file="cbl_migrator.log",
+    level=logging.DEBUG,
+    json_format=False,
+    chunk_rate=1.0,
+):
+    """
+    Configure and return a logger writing to a rotating file and the console
+    through a queue listener, so worker processes never write to the file
+    themselves.
+
+    Args:
+        name (str): Logger name.
+        log_file (str): Rotating log file, None for console only.
+        level (int): Logger level.
+        json_format (bool): Write the log file as JSON lines.
+        chunk_rate (float): Max per-chunk debug records per second and table.
+    """
+    global _queue, _listener, _chunk_rate
     logger = logging.getLogger(name)
     logger.setLevel(level)
 
     # Remove existing handlers to avoid duplicates
+    stop_logging()
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
 
-    # File handler with rotation
-    log_dir = os.path.dirname(log_file)
-    if log_dir and not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-    
-    file_handler = logging.handlers.RotatingFileHandler(
-        log_file,
-        maxBytes=10*1024*1024,  # 10MB
-        backupCount=5
-    )
-    file_handler.setLevel(logging.DEBUG)
+    handlers = []
+    if log_file:
+        # File handler with rotation
+        log_dir = os.path.dirname(log_file)
+        if log_dir and not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=10 * 1024 * 1024, backupCount=5  # 10MB
+        )
+        file_handler.setLevel(logging.DEBUG)
+        if json_format:
+            file_handler.setFormatter(JsonFormatter())
+        else:
+            file_handler.setFormatter(
+                logging.Formatter(
+                    "%(asctime)s - %(name)s - %(levelname)s - "
+                    "[%(filename)s:%(lineno)d] - %(message)s"
+                )
+            )
+        handlers.append(file_handler)
 
     # Console handler
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
-
-    # Create formatters and add them to the handlers
-    file_formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
-    )
-    console_formatter = logging.Formatter(
-        '%(asctime)s - %(levelname)s - %(message)s'
+    console_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
     )
+    handlers.append(console_handler)
 
-    file_handler.setFormatter(file_formatter)
-    console_handler.setFormatter(console_formatter)
+    _chunk_rate = chunk_rate
+    # Not a fork context queue, those can't be handed to spawned workers
+    # like the ones of a pool with max_tasks_per_child
+    _queue = multiprocessing.get_context("spawn").Queue(-1)
+    _listener = logging.handlers.QueueListener(
+        _queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+    # Registered after the queue so it runs before multiprocessing closes it
+    atexit.register(stop_logging)
+    logger.addHandler(_queue_handler(_queue, chunk_rate))
+    return logger
 
-    # Add the handlers to logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
 
+def ensure_logger(**kwargs):
+    """
+    Sets up the default logger unless it was configured already.
+    """
+    if _listener is None:
+        setup_logger(**kwargs)
     return logger
 
-# Create the default logger instance
-logger = setup_logger()
+
+def worker_initializer(queue, chunk_rate=1.0, name="cbl_migrator", level=logging.DEBUG):
+    """
+    Process pool initializer sending the records of the worker to the
+    coordinator queue. Needed for spawned workers, forked ones already
+    inherit the queue handler.
+    """
+    if queue is None:
+        return
+    worker_logger = logging.getLogger(name)
+    worker_logger.setLevel(level)
+    for handler in worker_logger.handlers[:]:
+        worker_logger.removeHandler(handler)
+    worker_logger.addHandler(_queue_handler(queue, chunk_rate))
+
+
+def worker_initargs():
+    """
+    Arguments for worker_initializer: the queue of the running listener
+    and the chunk records rate.
+    """
+    return _queue, _chunk_rate
+
+
+def stop_logging():
+    """
+    Flushes the pending records and stops the listener.
+    """
+    global _queue, _listener
+    atexit.unregister(stop_logging)
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _queue is not None:
+        _queue.close()
+        _queue = None
+
+
+# Default logger instance, handlers are set up on first use
+logger = logging.getLogger("cbl_migrator")
@@ -0,0 +1,83 @@
+import gc
+import os
+import sys
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+MB = 1024 * 1024
+
+
+def peak_rss():
+    """
+    Peak resident set size of the current process, in bytes.
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB everywhere else
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_rss():
+    """
+    Current resident set size of the current process, in bytes.
+    Falls back to the peak RSS where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+class MemoryBudget:
+    """
+    Keeps a worker under a RSS cap by shrinking the chunk size and
+    records the memory used while copying a table.
+
+    Attributes:
+        max_memory (int): RSS cap in bytes, None for no cap.
+        max_chunk_size (int): Configured chunk size, never exceeded when
+            growing chunks back.
+        start (int): RSS when the table copy started.
+        peak (int): Highest RSS seen while copying the table.
+    """
+
+    # Fraction of the cap above which chunks are shrunk
+    SOFT_LIMIT = 0.8
+
+    def __init__(self, max_memory=None, max_chunk_size=None):
+        self.max_memory = max_memory
+        self.max_chunk_size = max_chunk_size
+        self.start = current_rss()
+        self.peak = self.start
+
+    def chunk_size(self, chunk_size):
+        """
+        Samples the RSS after a chunk and returns the size for the next one,
+        halved while the worker is above the soft limit and doubled back
+        towards max_chunk_size while it stays under it.
+        """
+        rss = current_rss()
+        self.peak = max(self.peak, rss)
+        if not self.max_memory:
+            return chunk_size
+        if rss > self.max_memory * self.SOFT_LIMIT:
+            if chunk_size > 1:
+                gc.collect()
+                return max(1, chunk_size // 2)
+        elif self.max_chunk_size and chunk_size < self.max_chunk_size:
+            return min(self.max_chunk_size, chunk_size * 2)
+        return chunk_size
+
+    def summary(self):
+        end = current_rss()
+        self.peak = max(self.peak, end)
+        return (
+            f"start {self.start / MB:.1f} MB, peak {self.peak / MB:.1f} MB, "
+            f"end {end / MB:.1f} MB"
+        )
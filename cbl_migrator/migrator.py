@@ -9,66 +9,252 @@ from sqlalchemy import (
     CheckConstraint,
     MetaData,
     PrimaryKeyConstraint,
+    and_,
+    or_,
+    bindparam,
     func,
     create_engine,
     inspect,
+    literal_column,
+    true,
 )
+from sqlalchemy.types import LargeBinary, Text
 import concurrent.futures as cf
+from collections import deque
 import os
-from .conv import COLTYPE_CONV
-from .logs import logger
+import sys
+import time
+from .conv import (
+    compile_value_converter,
+    generic_type,
+    get_converter,
+    lob_engine_options,
+    set_output_type_handler,
+)
+from .lease import LEASE_TABLE, LeaseTable
+from .faults import (
+    REJECTS_TABLE,
+    TRANSIENT_ERRORS,
+    CopyAborted,
+    RejectSink,
+    clear_rejects,
+    count_rejects,
+    insert_rows,
+    is_transient,
+    sqlite_savepoints,
+    with_retries,
+)
+from .concurrency import ConcurrencyController
+from .optimize import optimize_tables
+from .origins import OriginPool
+from .physical import (
+    PHYSICAL_DIALECTS,
+    UNITS_TABLE,
+    UnitLog,
+    physical_range,
+    physical_units,
+)
+from .profiling import clear_profiles, report_profiles, run_profiled
+from .memory import MB, MemoryBudget, current_rss
+from .snapshot import Snapshot, apply_snapshot
+from .subset import compute_closure, fill_table_subset
+from .logs import ensure_logger, logger, worker_initargs, worker_initializer
+
+# ProcessPoolExecutor replaces its workers after max_tasks_per_child tasks
+NATIVE_MAX_TASKS = sys.version_info >= (3, 11)
+
+# Read and commit latencies of the chunks copied by the current worker task
+READ_LATENCIES = []
+WRITE_LATENCIES = []
+# Values (rows times columns) of the chunks read by the current worker task
+CHUNK_VALUES = []
+
+# Rows per PK range of the LOB pass, and per physical range, when no
+# range_size is given
+LOB_RANGE_SIZE = 100000
+PHYSICAL_RANGE_SIZE = 100000
+
+# Tables of the migrator itself in the destination
+INTERNAL_TABLES = (LEASE_TABLE, UNITS_TABLE, REJECTS_TABLE)
+
+
+def read_chunk(o_eng, q):
+    """
+    Reads a chunk from the origin, retrying transient errors
+    on a fresh connection.
+    """
+
+    def read():
+        ini = time.perf_counter()
+        with o_eng.connect() as connr:
+            res = connr.execute(q)
+            chunk = list(res.keys()), res.all()
+        READ_LATENCIES.append(time.perf_counter() - ini)
+        CHUNK_VALUES.append(len(chunk[0]) * len(chunk[1]))
+        return chunk
 
+    return with_retries(read, o_eng)
 
-def chunked_copy_single_pk(table, pk, last_id, chunk_size, o_eng, d_eng):
+
+def write_chunk(d_eng, table, rows, rejects=None):
+    """
+    Inserts a chunk in the destination with insert_rows, recording
+    its commit latency.
+    """
+    ini = time.perf_counter()
+    insert_rows(d_eng, table, rows, rejects)
+    WRITE_LATENCIES.append(time.perf_counter() - ini)
+
+
+def chunked_copy_single_pk(
+    table,
+    pk,
+    last_id,
+    chunk_size,
+    o_eng,
+    d_eng,
+    budget,
+    rejects=None,
+    where=None,
+    columns=None,
+    abort=None,
+):
     """
     Copies table data in chunks, assuming a single PK column.
+    Only the given columns are copied if any, the others are left null.
+    Stops with CopyAborted before writing a chunk once abort() is true.
     """
+    convert = compile_value_converter(table)
     first_it = True if last_id is None else False
+    n_chunk = 0
     while True:
-        q = select(table).order_by(pk).limit(chunk_size)
+        q = select(*(columns or table.columns)).order_by(pk).limit(chunk_size)
+        if where is not None:
+            q = q.where(where)
         if not first_it:
             q = q.where(pk > last_id)
         else:
             first_it = False
-        with o_eng.connect() as connr:
-            res = connr.execute(q)
-            data = res.all()
-            if data:
-                last_id = getattr(data[-1], pk.name)
-                with d_eng.begin() as conn:
-                    conn.execute(
-                        table.insert(),
-                        [dict(zip(res.keys(), row)) for row in data],
-                    )
-            else:
-                break
+        keys, data = read_chunk(o_eng, q)
+        if not data:
+            break
+        _check_abort(table, abort)
+        last_id = getattr(data[-1], pk.name)
+        write_chunk(d_eng, table, convert(keys, data), rejects)
+        n_chunk += 1
+        _log_chunk(table, n_chunk, len(data))
+        del data
+        chunk_size = _next_chunk_size(table, chunk_size, budget)
+
+
+def lob_columns(table):
+    """
+    Nullable LOB columns of a single PK table, the ones copied by fill_lobs
+    when LOBs are split into a second pass. Other tables keep their LOBs in
+    the first pass.
+    """
+    if len(table.primary_key.columns) != 1:
+        return []
+    return [
+        c
+        for c in table.columns
+        if isinstance(c.type, (Text, LargeBinary)) and c.nullable and not c.primary_key
+    ]
 
 
-def chunked_copy_multi_pk(table, pks, count, offset, chunk_size, o_eng, d_eng):
+def narrow_columns(table):
+    """
+    Columns of a table copied by the first pass when LOBs are split.
+    """
+    lobs = lob_columns(table)
+    return [c for c in table.columns if c not in lobs]
+
+
+def chunked_copy_multi_pk(
+    table,
+    pks,
+    count,
+    offset,
+    chunk_size,
+    o_eng,
+    d_eng,
+    budget,
+    rejects=None,
+    abort=None,
+):
     """
     Copies table data in chunks, assuming a composite PK.
+    Stops with CopyAborted before writing a chunk once abort() is true.
     """
-    for ini in range(offset, count - offset, chunk_size):
+    convert = compile_value_converter(table)
+    ini = offset
+    while ini < count:
         q = select(table).order_by(*pks).offset(ini).limit(chunk_size)
-        with o_eng.connect() as connr:
-            res = connr.execute(q)
-            data = res.all()
-            with d_eng.begin() as conn:
-                conn.execute(
-                    table.insert(),
-                    [dict(zip(res.keys(), row)) for row in data],
-                )
+        keys, data = read_chunk(o_eng, q)
+        _check_abort(table, abort)
+        write_chunk(d_eng, table, convert(keys, data), rejects)
+        _log_chunk(table, ini // chunk_size + 1, len(data))
+        del data
+        ini += chunk_size
+        chunk_size = _next_chunk_size(table, chunk_size, budget)
 
 
-def fill_table(o_eng_conn, d_eng_conn, table, chunk_size):
+def _check_abort(table, abort):
+    if abort is not None and abort():
+        raise CopyAborted(f"Copy of '{table.name}' aborted")
+
+
+def _log_chunk(table, n_chunk, rows):
+    logger.debug(
+        f"Copied chunk {n_chunk} of '{table.name}' ({rows} rows)",
+        extra={"table": table.name, "chunk": n_chunk, "rows": rows},
+    )
+
+
+def _next_chunk_size(table, chunk_size, budget):
+    new_size = budget.chunk_size(chunk_size)
+    if new_size < chunk_size:
+        logger.warning(
+            f"Worker close to its memory cap while copying '{table.name}', "
+            f"reducing chunk size from {chunk_size} to {new_size}"
+        )
+    elif new_size > chunk_size:
+        logger.info(
+            f"Worker back under its memory cap while copying '{table.name}', "
+            f"increasing chunk size from {chunk_size} to {new_size}"
+        )
+    return new_size
+
+
+def fill_table(
+    o_eng_conn,
+    d_eng_conn,
+    table,
+    chunk_size,
+    max_memory=None,
+    reject_dir=None,
+    snapshot=None,
+    narrow=False,
+    abort=None,
+):
     """
     Fills existing table in the destination with data from the origin.
     Skips if destination already has the same row count.
     Makes partial reads/writes depending on PK presence.
+    Chunks are shrunk when the worker RSS gets close to max_memory (bytes).
+    Rows refused by the destination are quarantined to reject_dir if given.
+    The origin is read at the snapshot token from Snapshot if given.
+    With narrow, LOB columns are left null for fill_lobs.
+    Stops with CopyAborted before writing a chunk once abort() is true.
     """
     logger.info(f"Starting migration of table '{table.name}'")
+    budget = MemoryBudget(max_memory, chunk_size)
+    rejects = RejectSink(reject_dir, table) if reject_dir else None
+    n_rejects = len(rejects) if rejects else 0
     d_eng = create_engine(d_eng_conn)
     o_eng = create_engine(o_eng_conn)
+    set_output_type_handler(o_eng)
+    apply_snapshot(o_eng, snapshot)
 
     # Adjust identifier length if necessary
     if d_eng.name == "mysql":
@@ -94,12 +280,12 @@ def fill_table(o_eng_conn, d_eng_conn, table, chunk_size):
             logger.error(f"Need to create {table.name} table before filling it", e)
             raise
 
-    if count == d_count:
+    if count == d_count + n_rejects:
         logger.info(
             f"Table '{table.name}' already matches origin row count ({count} rows). Skipping."
         )
         return True
-    elif count != d_count and d_count != 0:
+    elif d_count != 0:
         logger.info(f"Resuming migration of '{table.name}' from last ID")
         q = select(pk).order_by(pk.desc()).limit(1)
         with d_eng.connect() as conn:
@@ -110,27 +296,435 @@ def fill_table(o_eng_conn, d_eng_conn, table, chunk_size):
 
     # Multi or single PK copy
     if single_pk:
-        chunked_copy_single_pk(table, pk, last_id, chunk_size, o_eng, d_eng)
+        chunked_copy_single_pk(
+            table,
+            pk,
+            last_id,
+            chunk_size,
+            o_eng,
+            d_eng,
+            budget,
+            rejects,
+            columns=narrow_columns(table) if narrow else None,
+            abort=abort,
+        )
     else:
-        offset = d_count if last_id else 0
-        chunked_copy_multi_pk(table, pks, count, offset, chunk_size, o_eng, d_eng)
+        offset = d_count + n_rejects if last_id else 0
+        chunked_copy_multi_pk(
+            table,
+            pks,
+            count,
+            offset,
+            chunk_size,
+            o_eng,
+            d_eng,
+            budget,
+            rejects,
+            abort,
+        )
 
+    if rejects:
+        logger.warning(
+            f"{len(rejects)} rows of '{table.name}' quarantined to {rejects.path}"
+        )
     logger.info(f"Successfully completed migration of table '{table.name}'")
+    logger.info(f"Memory used by worker copying '{table.name}': {budget.summary()}")
     return True
 
 
+def pk_range(pk, lo, hi):
+    """
+    Clause selecting the rows with lo <= pk < hi, None meaning open ended.
+    """
+    clauses = []
+    if lo is not None:
+        clauses.append(pk >= lo)
+    if hi is not None:
+        clauses.append(pk < hi)
+    return and_(true(), *clauses)
+
+
+def plan_units(o_eng, tables, range_size):
+    """
+    Splits tables into work units of about range_size rows.
+
+    Single PK tables are split into PK ranges by walking their PK in order,
+    other tables make a single unit.
+
+    Returns:
+        list[tuple]: (table_name, lo, hi) units, lo/hi None for open ends.
+    """
+    units = []
+    with o_eng.connect() as conn:
+        for table in tables:
+            pks = list(table.primary_key.columns)
+            if len(pks) != 1 or not range_size:
+                units.append((table.name, None, None))
+                continue
+            q = select(pks[0]).order_by(pks[0])
+            res = conn.execution_options(stream_results=True).execute(q)
+            bounds = [row[0] for i, row in enumerate(res) if i and i % range_size == 0]
+            for lo, hi in zip([None] + bounds, bounds + [None]):
+                units.append((table.name, lo, hi))
+    return units
+
+
+def fill_range(
+    o_eng_conn,
+    d_eng_conn,
+    table,
+    lo,
+    hi,
+    chunk_size,
+    max_memory=None,
+    reject_dir=None,
+    snapshot=None,
+    narrow=False,
+    abort=None,
+):
+    """
+    Fills the rows of a single PK table with lo <= PK < hi. Skips the range if
+    the destination already has the same row count, otherwise replaces the
+    rows already copied, so a range left half done can be copied again.
+    Tables without a single PK are filled as a whole with fill_table.
+    With narrow, LOB columns are left null for fill_lobs.
+    Stops with CopyAborted before writing a chunk once abort() is true.
+
+    Returns:
+        int: Rows in the range in the origin.
+    """
+    pks = list(table.primary_key.columns)
+    if len(pks) != 1:
+        fill_table(
+            o_eng_conn,
+            d_eng_conn,
+            table,
+            chunk_size,
+            max_memory,
+            reject_dir,
+            snapshot,
+            narrow,
+            abort,
+        )
+        o_eng = create_engine(o_eng_conn)
+        apply_snapshot(o_eng, snapshot)
+        with o_eng.connect() as conn:
+            return conn.execute(select(func.count()).select_from(table)).scalar()
+
+    pk = pks[0]
+    where = pk_range(pk, lo, hi)
+    logger.info(f"Starting migration of '{table.name}' range [{lo}, {hi})")
+    budget = MemoryBudget(max_memory, chunk_size)
+    rejects = RejectSink(reject_dir, table) if reject_dir else None
+    n_rejects = 0
+    if rejects:
+        n_rejects = sum(
+            1
+            for (value,) in rejects.pks
+            if (lo is None or value >= lo) and (hi is None or value < hi)
+        )
+    d_eng = create_engine(d_eng_conn)
+    o_eng = create_engine(o_eng_conn)
+    set_output_type_handler(o_eng)
+    apply_snapshot(o_eng, snapshot)
+
+    count_q = select(func.count()).select_from(table).where(where)
+    count = with_retries(lambda: _scalar(o_eng, count_q), o_eng)
+    d_count = with_retries(lambda: _scalar(d_eng, count_q), d_eng)
+    if count == d_count + n_rejects:
+        logger.info(
+            f"Range [{lo}, {hi}) of '{table.name}' already matches origin row count "
+            f"({count} rows). Skipping."
+        )
+        return count
+    if d_count:
+        with d_eng.begin() as conn:
+            conn.execute(table.delete().where(where))
+
+    chunked_copy_single_pk(
+        table,
+        pk,
+        None,
+        chunk_size,
+        o_eng,
+        d_eng,
+        budget,
+        rejects,
+        where,
+        columns=narrow_columns(table) if narrow else None,
+        abort=abort,
+    )
+    logger.info(
+        f"Successfully completed migration of '{table.name}' range [{lo}, {hi}), "
+        f"memory {budget.summary()}"
+    )
+    return count
+
+
+def fill_physical(
+    o_eng_conn,
+    d_eng_conn,
+    table,
+    lo,
+    hi,
+    chunk_size,
+    max_memory=None,
+    reject_dir=None,
+    snapshot=None,
+    narrow=False,
+):
+    """
+    Fills the rows of a physical range from physical_units, streaming them
+    with a sequential scan of the range. Works for tables without PK.
+
+    The whole range is inserted in a single destination transaction that
+    also marks it done in the UnitLog, so a range is either fully copied or
+    not at all, and is skipped when resuming. Transient errors copy the
+    range again from the start.
+
+    Returns:
+        int: Rows in the range in the origin.
+    """
+    logger.info(f"Starting migration of '{table.name}' physical range [{lo}, {hi}]")
+    budget = MemoryBudget(max_memory, chunk_size)
+    rejects = RejectSink(reject_dir, table) if reject_dir else None
+    d_eng = create_engine(d_eng_conn)
+    if d_eng.name == "sqlite":
+        sqlite_savepoints(d_eng)
+    o_eng = create_engine(o_eng_conn)
+    set_output_type_handler(o_eng)
+    apply_snapshot(o_eng, snapshot)
+    units = UnitLog(d_eng)
+
+    rows = units.rows(table.name, lo, hi)
+    if rows is not None:
+        logger.info(
+            f"Physical range [{lo}, {hi}] of '{table.name}' already copied "
+            f"({rows} rows). Skipping."
+        )
+        return rows
+
+    convert = compile_value_converter(table)
+    columns = narrow_columns(table) if narrow else table.columns
+    q = select(*columns).where(physical_range(o_eng.name, lo, hi))
+
+    def copy():
+        n_rows = 0
+        n_chunk = 0
+        size = chunk_size
+        with d_eng.begin() as d_conn, o_eng.connect() as o_conn:
+            res = o_conn.execution_options(stream_results=True).execute(q)
+            keys = list(res.keys())
+            while True:
+                ini = time.perf_counter()
+                data = res.fetchmany(size)
+                READ_LATENCIES.append(time.perf_counter() - ini)
+                CHUNK_VALUES.append(len(keys) * len(data))
+                if not data:
+                    break
+                ini = time.perf_counter()
+                insert_rows(d_eng, table, convert(keys, data), rejects, d_conn)
+                WRITE_LATENCIES.append(time.perf_counter() - ini)
+                n_chunk += 1
+                n_rows += len(data)
+                _log_chunk(table, n_chunk, len(data))
+                del data
+                size = _next_chunk_size(table, size, budget)
+            units.done(d_conn, table.name, lo, hi, n_rows)
+        return n_rows
+
+    count = with_retries(copy, d_eng)
+    logger.info(
+        f"Successfully completed migration of '{table.name}' physical range "
+        f"[{lo}, {hi}] ({count} rows), memory {budget.summary()}"
+    )
+    return count
+
+
+def lob_counts(eng, table, lobs, where, exclude_pks=None):
+    """
+    Non null values of each LOB column in the rows matching where,
+    leaving out the rows whose PK is in exclude_pks.
+    """
+    if exclude_pks:
+        where = and_(where, table.primary_key.columns[0].notin_(exclude_pks))
+    q = select(*[func.count(c) for c in lobs]).select_from(table).where(where)
+    with eng.connect() as conn:
+        return list(conn.execute(q).one())
+
+
+def fill_lobs(
+    o_eng_conn,
+    d_eng_conn,
+    table,
+    lo,
+    hi,
+    chunk_size,
+    max_memory=None,
+    reject_dir=None,
+    snapshot=None,
+):
+    """
+    Second pass of a table whose LOBs are split: fills the LOB columns of the
+    rows with lo <= PK < hi, already copied by the first pass, with updates
+    by PK. LOBs are fetched as locators LOB_ARRAYSIZE rows per round trip and
+    read piecewise, instead of inline in the buffers of the narrow columns.
+    Skips the range if every LOB column already has as many non null values
+    as in the origin. Rows quarantined by the first pass are left out.
+
+    Returns:
+        int: Rows with LOBs copied.
+    """
+    pk = table.primary_key.columns[0]
+    lobs = lob_columns(table)
+    where = pk_range(pk, lo, hi)
+    budget = MemoryBudget(max_memory, chunk_size)
+    rejected = []
+    if reject_dir:
+        rejected = [value for (value,) in RejectSink(reject_dir, table).pks]
+    d_eng = create_engine(d_eng_conn)
+    o_eng = create_engine(o_eng_conn, **lob_engine_options(o_eng_conn))
+    set_output_type_handler(o_eng)
+    apply_snapshot(o_eng, snapshot)
+
+    o_counts = with_retries(
+        lambda: lob_counts(o_eng, table, lobs, where, rejected), o_eng
+    )
+    d_counts = with_retries(lambda: lob_counts(d_eng, table, lobs, where), d_eng)
+    if o_counts == d_counts:
+        logger.info(
+            f"LOBs of '{table.name}' range [{lo}, {hi}) already copied. Skipping."
+        )
+        return 0
+    logger.info(f"Starting LOB copy of '{table.name}' range [{lo}, {hi})")
+
+    convert = compile_value_converter(table)
+    update = (
+        table.update()
+        .where(pk == bindparam(f"b_{pk.name}"))
+        .values({c.name: bindparam(f"b_{c.name}") for c in lobs})
+    )
+    # Rows without any LOB have nothing to update
+    where = and_(where, or_(*[c.isnot(None) for c in lobs]))
+    last_id = None
+    n_chunk = 0
+    n_rows = 0
+    while True:
+        q = select(pk, *lobs).where(where).order_by(pk).limit(chunk_size)
+        if last_id is not None:
+            q = q.where(pk > last_id)
+        keys, data = read_chunk(o_eng, q)
+        if not data:
+            break
+        last_id = data[-1][0]
+        params = [
+            {f"b_{key}": value for key, value in row.items()}
+            for row in convert(keys, data)
+        ]
+
+        def write():
+            with d_eng.begin() as conn:
+                conn.execute(update, params)
+
+        ini = time.perf_counter()
+        with_retries(write, d_eng)
+        WRITE_LATENCIES.append(time.perf_counter() - ini)
+        n_chunk += 1
+        n_rows += len(data)
+        _log_chunk(table, n_chunk, len(data))
+        del data, params
+        chunk_size = _next_chunk_size(table, chunk_size, budget)
+
+    logger.info(
+        f"Successfully completed LOB copy of '{table.name}' range [{lo}, {hi}), "
+        f"memory {budget.summary()}"
+    )
+    return n_rows
+
+
+def _scalar(eng, q):
+    with eng.connect() as conn:
+        return conn.execute(q).scalar()
+
+
+def run_task(func, *args):
+    """
+    Runs a table task in a pool worker and reports the worker RSS
+    afterwards, so the coordinator can recycle it, the mean chunk read
+    latency, so it can place the next jobs on the fastest origin, and the
+    commit latency, transient errors and chunk values, for the concurrency
+    controller.
+    """
+    del READ_LATENCIES[:]
+    del WRITE_LATENCIES[:]
+    del CHUNK_VALUES[:]
+    del TRANSIENT_ERRORS[:]
+    res = func(*args)
+    return {
+        "result": res,
+        "rss": current_rss(),
+        "read_latency": mean_read_latency(),
+        "commit_latency": _mean(WRITE_LATENCIES),
+        "chunks": len(READ_LATENCIES),
+        "errors": len(TRANSIENT_ERRORS),
+        "values": _mean(CHUNK_VALUES),
+    }
+
+
+def mean_read_latency():
+    """
+    Mean read latency of the chunks read since READ_LATENCIES was cleared.
+    """
+    return _mean(READ_LATENCIES)
+
+
+def _mean(values):
+    if not values:
+        return None
+    return sum(values) / len(values)
+
+
+def _is_empty(conn, table):
+    q = select(literal_column("1")).select_from(table).limit(1)
+    return conn.execute(q).first() is None
+
+
+def _job_name(job):
+    table, lo, hi = job
+    if lo is None and hi is None:
+        return f"Table {table.name}"
+    return f"Table {table.name} range [{lo}, {hi})"
+
+
 class DbMigrator:
     """
     Handles database migrations from an origin DB to a destination DB.
 
     Attributes:
-        o_conn_string (str): Origin DB connection string.
+        o_conn_string (str | list[str]): Origin DB connection string, or the
+            primary followed by read replicas to spread the reads across.
         d_conn_string (str): Destination DB connection string.
         exclude (list[str]): List of tables to exclude from migration.
         exclude_fields (list[str]): List of fields to exclude in format 'table.field'.
         n_cores (int): Number of processes used for data copying.
+        reject_dir (str): Directory where rows refused by the destination are
+            quarantined, one JSON lines file per table, or connection string of
+            a DB keeping them in a cbl_migrator_rejects table. None to fail
+            instead.
+        accept_rejects (bool): Count quarantined rows as migrated, otherwise
+            validation fails when a table has any.
+        max_replica_lag (float): Seconds of replication lag above which a
+            replica stops being read from.
+        chunking (str): 'pk' to read tables by PK order, tables without PK
+            being excluded, or 'physical' to read them by physical row
+            location ranges (Oracle ROWID, PostgreSQL ctid, SQLite rowid),
+            tables without PK included. Subset and distributed runs need
+            PK chunking.
     """
 
+    # Attempts for a table whose worker died before giving up on it
+    MAX_TABLE_ATTEMPTS = 3
+
     def __init__(
         self,
         o_conn_string,
@@ -138,14 +732,25 @@ class DbMigrator:
         exclude_tables=None,
         exclude_fields=None,
         n_workers=4,
+        reject_dir=None,
+        max_replica_lag=None,
+        chunking="pk",
+        accept_rejects=False,
     ):
         if exclude_tables is None:
             exclude_tables = []
         if exclude_fields is None:
             exclude_fields = []
-        self.o_eng_conn = o_conn_string
+        if isinstance(o_conn_string, str):
+            o_conn_string = [o_conn_string]
+        self.o_eng_conns = list(o_conn_string)
+        self.o_eng_conn = self.o_eng_conns[0]
+        self.max_replica_lag = max_replica_lag
         self.d_eng_conn = d_conn_string
         self.n_cores = n_workers
+        self.reject_dir = reject_dir
+        self.accept_rejects = accept_rejects
+        ensure_logger()
         self.exclude_fields = {}
         for item in exclude_fields:
             table, field = item.lower().split(".")
@@ -154,36 +759,35 @@ class DbMigrator:
             self.exclude_fields[table].append(field)
 
         o_eng = create_engine(self.o_eng_conn)
+        if chunking not in ("pk", "physical"):
+            raise ValueError(f"Unknown chunking '{chunking}'")
+        if chunking == "physical" and o_eng.name not in PHYSICAL_DIALECTS:
+            logger.warning(
+                f"Physical chunking not available for {o_eng.name}, using PKs"
+            )
+            chunking = "pk"
+        self.chunking = chunking
+
         metadata = MetaData()
         metadata.reflect(o_eng)
-        no_pk = [
-            table_name.lower()
-            for table_name, table in metadata.tables.items()
-            if not list(table.primary_key.columns)
-        ]
+        no_pk = []
+        if chunking == "pk":
+            no_pk = [
+                table_name.lower()
+                for table_name, table in metadata.tables.items()
+                if not list(table.primary_key.columns)
+            ]
+        if no_pk:
+            logger.warning(f"Excluding tables without PK: {', '.join(no_pk)}")
         self.exclude_tables = exclude_tables + no_pk
 
-    def __fix_column_type(self, col, o_eng, d_eng):
+    def __fix_column_type(self, col, convert):
         """
         Adapts column types to generic types and unsets server defaults.
         """
-        cls = col.type.__class__
-        for supercls in cls.__mro__:
-            if hasattr(supercls, "__visit_name__"):
-                cls = supercls
-            if (
-                supercls.__name__ != supercls.__name__.upper()
-                and not supercls.__name__.startswith("_")
-            ):
-                break
-        col.type = col.type.adapt(cls)
+        col.type = col.type.adapt(generic_type(col.type.__class__))
         col.server_default = None
-
-        if o_eng in COLTYPE_CONV and d_eng in COLTYPE_CONV[o_eng]:
-            col = COLTYPE_CONV[o_eng][d_eng](col)
-        else:
-            raise Exception(f"Migration from {o_eng} to {d_eng} not available")
-        return col
+        return convert(col)
 
     def __copy_schema(self):
         """
@@ -195,6 +799,7 @@ class DbMigrator:
         metadata = MetaData()
         metadata.reflect(o_eng)
         insp = inspect(o_eng)
+        convert = get_converter(o_eng.name, d_eng.name)
 
         new_metadata_tables = {}
         # Filter tables, excluding those in self.exclude_tables
@@ -257,7 +862,7 @@ class DbMigrator:
             excluded_fields = self.exclude_fields.get(table_name.lower(), [])
             for col in table._columns:
                 if col.name.lower() not in excluded_fields:
-                    col = self.__fix_column_type(col, o_eng.name, d_eng.name)
+                    col = self.__fix_column_type(col, convert)
                     col.autoincrement = False
                     new_metadata_cols.add(col)
             table.columns = new_metadata_cols.as_readonly()
@@ -266,12 +871,19 @@ class DbMigrator:
         metadata.tables = immutabledict(new_metadata_tables)
         metadata.create_all(d_eng)
 
-    def validate_migration(self):
+    def validate_migration(self, snapshot=None, split_lobs=False, reject_dir=None):
         """
         Checks row counts for all tables in both origin and destination
-        to confirm migration success.
+        to confirm migration success. Rows quarantined in reject_dir, or
+        else in the reject_dir of the migrator, fail it unless the migrator
+        accepts rejects, in which case they count as migrated.
+        Origin rows are counted at the snapshot token from Snapshot if given.
+        With split_lobs, tables whose LOBs were copied by a second pass also
+        need the same number of non null values in each LOB column.
         """
+        reject_dir = reject_dir or self.reject_dir
         o_eng = create_engine(self.o_eng_conn)
+        apply_snapshot(o_eng, snapshot)
         o_metadata = MetaData()
         o_metadata.reflect(o_eng)
         d_eng = create_engine(self.d_eng_conn)
@@ -287,7 +899,10 @@ class DbMigrator:
         # Get destination tables, excluding those in exclude_tables
         d_tables = {}
         for table_name, table in d_metadata.tables.items():
-            if table_name.lower() not in self.exclude_tables:
+            if (
+                table_name.lower() not in self.exclude_tables
+                and table_name not in INTERNAL_TABLES
+            ):
                 d_tables[table_name] = table
 
         if set(o_tables.keys()) != set(d_tables.keys()):
@@ -301,13 +916,57 @@ class DbMigrator:
                 d_count = d_s.execute(
                     select(func.count()).select_from(migrated_table)
                 ).scalar()
-                if o_count != d_count:
+                n_rejects = count_rejects(reject_dir, table_name)
+                if n_rejects and self.accept_rejects:
+                    logger.warning(
+                        f"{n_rejects} rows of {table_name} were rejected by the "
+                        f"destination, see {RejectSink(reject_dir, table).path}"
+                    )
+                elif n_rejects:
+                    logger.error(
+                        f"{n_rejects} rows of {table_name} were rejected by the "
+                        f"destination, see {RejectSink(reject_dir, table).path}"
+                    )
+                    validated = False
+                if o_count != d_count + n_rejects:
                     logger.error(
                         f"Row count mismatch for {table_name}: {o_count} vs {d_count}"
                     )
                     validated = False
+                lobs = lob_columns(migrated_table) if split_lobs else []
+                if lobs and not self.__lobs_match(
+                    o_eng, d_eng, table, migrated_table, lobs, reject_dir
+                ):
+                    validated = False
         return validated
 
+    def __lobs_match(self, o_eng, d_eng, table, migrated_table, lobs, reject_dir):
+        """
+        Whether the LOB pass of a table is complete, leaving out the
+        rows quarantined by the first pass.
+        """
+        rejected = []
+        if reject_dir:
+            rejected = [
+                value for (value,) in RejectSink(reject_dir, migrated_table).pks
+            ]
+        o_counts = lob_counts(
+            o_eng,
+            table,
+            [table.columns[c.name] for c in lobs],
+            true(),
+            rejected,
+        )
+        d_counts = lob_counts(d_eng, migrated_table, lobs, true())
+        if o_counts != d_counts:
+            logger.error(
+                f"LOB pass of {migrated_table.name} incomplete: "
+                f"{dict(zip([c.name for c in lobs], o_counts))} vs "
+                f"{dict(zip([c.name for c in lobs], d_counts))} non null values"
+            )
+            return False
+        return True
+
     def __copy_constraints(self):
         """
         Migrates constraints to the destination DB (UK, CK, FK), skipping those
@@ -414,6 +1073,19 @@ class DbMigrator:
         copy_constraints=True,
         copy_indexes=True,
         chunk_size=1000,
+        max_worker_memory=None,
+        max_tasks_per_child=None,
+        range_size=None,
+        snapshot=False,
+        split_lobs=False,
+        lob_chunk_size=100,
+        adaptive_concurrency=False,
+        min_workers=1,
+        read_latency_slo=None,
+        commit_latency_slo=None,
+        optimize=False,
+        sqlite_page_size=None,
+        profile=None,
     ):
         """
         Orchestrates the migration from the origin DB to the destination DB.
@@ -424,6 +1096,32 @@ class DbMigrator:
             copy_constraints (bool): Migrate constraints to destination.
             copy_indexes (bool): Migrate indexes to destination.
             chunk_size (int): Batch size for chunked copying.
+            max_worker_memory (int): Worker RSS cap in MB. Chunks shrink when a
+                worker gets close to it and workers above it are recycled.
+            max_tasks_per_child (int): Recycle workers after about this many
+                tables each.
+            range_size (int): Split single PK tables into PK-range jobs of
+                about this many rows, copied in parallel.
+            snapshot (bool): Read the whole origin at a single point in time,
+                so it can be migrated while it is being written to.
+            split_lobs (bool): Copy the nullable LOB columns of single PK
+                tables in a second pass, by PK ranges, once the narrow
+                columns of all tables are copied.
+            lob_chunk_size (int): Batch size of the LOB pass.
+            adaptive_concurrency (bool): Adjust the jobs copied at the same
+                time between min_workers and n_workers, backing off when the
+                origin or the destination get slower or start failing.
+            min_workers (int): Lower bound of the adaptive concurrency.
+            read_latency_slo (float): Chunk read latency in seconds above
+                which concurrency is reduced, twice the best one by default.
+            commit_latency_slo (float): Same for the chunk commit latency.
+            optimize (bool): Gather statistics and vacuum the destination
+                tables once migrated, see optimize.
+            sqlite_page_size (int): Page size of a SQLite destination,
+                set when it's vacuumed.
+            profile (str): Directory where each data copy job writes its
+                cProfile stats, merged into a ranked hotspot report
+                (hotspots.txt) once the data is copied.
         """
         logger.info(
             f"Starting database migration with settings: schema={copy_schema}, "
@@ -453,43 +1151,585 @@ class DbMigrator:
             logger.info("Schema copy completed successfully")
 
         # Fill tables with data
+        snap = Snapshot(o_eng) if snapshot and copy_data else None
+        token = snap.token if snap else None
+        origins = self.o_eng_conns
+        if snap and not snap.shareable and len(origins) > 1:
+            logger.warning("Snapshot only valid in the primary, not using replicas")
+            origins = origins[:1]
+        controller = None
+        if adaptive_concurrency and copy_data and d_eng.name != "sqlite":
+            controller = ConcurrencyController(
+                self.n_cores,
+                min_workers=min_workers,
+                read_latency_slo=read_latency_slo,
+                commit_latency_slo=commit_latency_slo,
+            )
+        if profile:
+            clear_profiles(profile)
+        try:
+            all_migrated = self.__copy_data(
+                copy_data,
+                o_eng,
+                d_eng,
+                origins,
+                token,
+                chunk_size,
+                max_worker_memory,
+                max_tasks_per_child,
+                range_size,
+                split_lobs,
+                lob_chunk_size,
+                controller,
+                profile,
+            )
+        finally:
+            if snap:
+                snap.close()
+            if profile:
+                report_profiles(profile)
+        return self.__finish(
+            d_eng,
+            all_migrated,
+            copy_constraints,
+            copy_indexes,
+            optimize,
+            sqlite_page_size,
+            internal_tables=(UNITS_TABLE, REJECTS_TABLE),
+        )
+
+    def __copy_data(
+        self,
+        copy_data,
+        o_eng,
+        d_eng,
+        origins,
+        token,
+        chunk_size,
+        max_worker_memory,
+        max_tasks_per_child,
+        range_size,
+        split_lobs=False,
+        lob_chunk_size=100,
+        controller=None,
+        profile=None,
+    ):
+        """
+        Copies the data of all tables and validates the row counts.
+        With split_lobs, LOB columns are copied by a second round of jobs.
+        """
         if copy_data:
-            metadata = MetaData()
-            metadata.reflect(d_eng)
-            insp = inspect(d_eng)
-            # Get all table names excluding the ones in self.exclude_tables
-            all_tables_and_fks = insp.get_sorted_table_and_fkc_names()
-            table_names = [
-                table_name
-                for table_name, _ in all_tables_and_fks
-                if table_name and table_name.lower() not in self.exclude_tables
-            ]
+            tables = self.__sorted_tables(d_eng)
+            max_memory = max_worker_memory * MB if max_worker_memory else None
+            units = UnitLog(d_eng) if self.chunking == "physical" else None
+            self.__reset_empty_tables(d_eng, tables, self.reject_dir, units)
+            if units:
+                # Ranges are dropped once a migration succeeds, its tables
+                # are not copied again
+                with d_eng.connect() as conn:
+                    copied = {
+                        table.name
+                        for table in tables
+                        if not units.planned(table.name) and not _is_empty(conn, table)
+                    }
+                for name in copied:
+                    logger.info(
+                        f"'{name}' was copied by a previous migration. Skipping."
+                    )
+                jobs = [
+                    (table, lo, hi)
+                    for table in tables
+                    if table.name not in copied
+                    for lo, hi in units.plan(
+                        table.name,
+                        lambda: physical_units(
+                            o_eng, table, range_size or PHYSICAL_RANGE_SIZE
+                        ),
+                    )
+                ]
+            elif range_size:
+                by_name = {table.name: table for table in tables}
+                jobs = [
+                    (by_name[name], lo, hi)
+                    for name, lo, hi in plan_units(o_eng, tables, range_size)
+                ]
+            else:
+                jobs = [(table, None, None) for table in tables]
 
-            tables = [metadata.tables[t] for t in table_names]
+            def make_task(job, chunk_size, origin):
+                if self.chunking == "physical":
+                    task = (fill_physical, origin, self.d_eng_conn, *job)
+                elif range_size:
+                    task = (fill_range, origin, self.d_eng_conn, *job)
+                else:
+                    task = (fill_table, origin, self.d_eng_conn, job[0])
+                return task + (
+                    chunk_size,
+                    max_memory,
+                    self.reject_dir,
+                    token,
+                    split_lobs,
+                )
 
-            processes = 1 if d_eng.name == "sqlite" else self.n_cores
+            self.__run_jobs(
+                d_eng,
+                jobs,
+                make_task,
+                chunk_size,
+                max_worker_memory=max_memory,
+                max_tasks_per_child=max_tasks_per_child,
+                origins=origins,
+                controller=controller,
+                profile_dir=profile,
+            )
 
-            logger.info(f"Starting data migration using {processes} processes")
+            lob_tables = [table for table in tables if lob_columns(table)]
+            if split_lobs and lob_tables:
+                logger.info(
+                    f"Starting LOB pass of {len(lob_tables)} tables: "
+                    + ", ".join(table.name for table in lob_tables)
+                )
+                by_name = {table.name: table for table in lob_tables}
+                self.__run_jobs(
+                    d_eng,
+                    [
+                        (by_name[name], lo, hi)
+                        for name, lo, hi in plan_units(
+                            o_eng, lob_tables, range_size or LOB_RANGE_SIZE
+                        )
+                    ],
+                    lambda job, chunk_size, origin: (
+                        fill_lobs,
+                        origin,
+                        self.d_eng_conn,
+                        *job,
+                        chunk_size,
+                        max_memory,
+                        self.reject_dir,
+                        token,
+                    ),
+                    lob_chunk_size,
+                    max_worker_memory=max_memory,
+                    max_tasks_per_child=max_tasks_per_child,
+                    origins=origins,
+                    controller=controller,
+                    profile_dir=profile,
+                )
 
-            with cf.ProcessPoolExecutor(max_workers=processes) as exe:
-                futures = {
-                    exe.submit(
-                        fill_table, self.o_eng_conn, self.d_eng_conn, table, chunk_size
-                    ): table
-                    for table in tables
-                }
-                for future in cf.as_completed(futures):
-                    tbl = futures[future]
+        # Validate row counts
+        return not copy_data or self.validate_migration(token, split_lobs)
+
+    def __reset_empty_tables(self, d_eng, tables, reject_dir, units=None):
+        """
+        Forgets the physical ranges in units of the tables empty in the
+        destination, so they are copied again, and clears the rows
+        quarantined in reject_dir by a previous migration of them, so they
+        are not counted as migrated.
+        """
+        if not reject_dir and not units:
+            return
+        with d_eng.connect() as conn:
+            for table in tables:
+                if not _is_empty(conn, table):
+                    continue
+                n_rejects = clear_rejects(reject_dir, table.name) if reject_dir else 0
+                if n_rejects:
+                    logger.info(
+                        f"Cleared {n_rejects} rows of '{table.name}' quarantined "
+                        "by a previous migration"
+                    )
+                if units:
+                    units.forget(table.name)
+
+    def publish_units(
+        self, lease_conn_string, copy_schema=True, range_size=100000, reject_dir=None
+    ):
+        """
+        Coordinator side of a distributed migration. Creates the schema in the
+        destination and publishes table/PK-range work units in a lease table,
+        for cbl_migrator.worker.run_worker processes to copy.
+
+        Args:
+            lease_conn_string (str): DB holding the lease table, the destination
+                itself or a shared SQLite file.
+            copy_schema (bool): Create tables in destination from origin's schema.
+            range_size (int): Rows per PK-range unit.
+            reject_dir (str): Where the workers quarantine refused rows, the
+                reject_dir of the migrator by default. The lease DB lets
+                the coordinator see the rejects of every host.
+
+        Returns:
+            LeaseTable: The lease table, to follow the progress.
+        """
+        if self.chunking == "physical":
+            raise Exception("Physical chunking is not available for distributed runs")
+        o_eng = create_engine(self.o_eng_conn)
+        d_eng = create_engine(self.d_eng_conn)
+        if copy_schema:
+            logger.info("Starting schema copy")
+            self.__copy_schema()
+            logger.info("Schema copy completed successfully")
+
+        lease = LeaseTable(lease_conn_string)
+        tables = self.__sorted_tables(d_eng)
+        self.__reset_empty_tables(d_eng, tables, reject_dir or self.reject_dir)
+        lease.publish(plan_units(o_eng, tables, range_size))
+        return lease
+
+    def finalize_units(
+        self,
+        lease_conn_string,
+        copy_constraints=True,
+        copy_indexes=True,
+        reject_dir=None,
+    ):
+        """
+        Validates a distributed migration once all its units are done, then
+        migrates constraints and indexes. Rows quarantined by the workers are
+        read from reject_dir, the reject_dir of the migrator by default.
+        """
+        lease = LeaseTable(lease_conn_string)
+        progress = lease.progress()
+        logger.info(f"Distributed migration progress: {progress}")
+        all_migrated = progress[LeaseTable.DONE] == progress["units"]
+        all_migrated = all_migrated and self.validate_migration(reject_dir=reject_dir)
+        d_eng = create_engine(self.d_eng_conn)
+        # A lease table in its own DB is left for the progress command
+        internal_tables = (REJECTS_TABLE,)
+        if lease_conn_string == self.d_eng_conn:
+            internal_tables += (LEASE_TABLE,)
+        return self.__finish(
+            d_eng,
+            all_migrated,
+            copy_constraints,
+            copy_indexes,
+            internal_tables=internal_tables,
+        )
+
+    def migrate_subset(
+        self,
+        roots,
+        sample_pct=None,
+        include_children=False,
+        copy_schema=True,
+        copy_constraints=True,
+        copy_indexes=True,
+        chunk_size=1000,
+        snapshot=False,
+    ):
+        """
+        Migrates an FK-consistent subset of the origin DB.
+
+        Only the rows selected in the root tables and the rows they reference
+        (and optionally the rows referencing them) are copied.
+
+        Args:
+            roots (dict[str, str] | list[str]): Root tables, optionally mapped
+                to a SQL predicate selecting their rows.
+            sample_pct (float): Percentage of the root rows to keep.
+            include_children (bool): Also copy the rows referencing the roots.
+            copy_schema (bool): Create tables in destination from origin's schema.
+            copy_constraints (bool): Migrate constraints to destination.
+            copy_indexes (bool): Migrate indexes to destination.
+            chunk_size (int): Batch size for the pushed-down IN lists.
+            snapshot (bool): Compute and copy the subset at a single point in
+                time of the origin.
+        """
+        if self.chunking == "physical":
+            raise Exception("Physical chunking is not available for subset runs")
+        if not isinstance(roots, dict):
+            roots = {name: None for name in roots}
+        logger.info(
+            f"Starting subset migration with roots={roots}, sample_pct={sample_pct}, "
+            f"include_children={include_children}, chunk_size={chunk_size}"
+        )
+
+        o_eng = create_engine(self.o_eng_conn)
+        d_eng = create_engine(self.d_eng_conn)
+        o_metadata = MetaData()
+        o_metadata.reflect(o_eng)
+
+        snap = Snapshot(o_eng) if snapshot else None
+        token = snap.token if snap else None
+        origins = self.o_eng_conns
+        if snap and not snap.shareable:
+            origins = origins[:1]
+        try:
+            closure_eng = create_engine(self.o_eng_conn)
+            apply_snapshot(closure_eng, token)
+            keys = compute_closure(
+                closure_eng,
+                o_metadata,
+                roots,
+                sample_pct=sample_pct,
+                include_children=include_children,
+                exclude_tables=self.exclude_tables,
+                chunk_size=chunk_size,
+            )
+
+            if copy_schema:
+                logger.info("Starting schema copy")
+                self.__copy_schema()
+                logger.info("Schema copy completed successfully")
+
+            tables = [t for t in self.__sorted_tables(d_eng) if t.name in keys]
+            self.__run_jobs(
+                d_eng,
+                [(table, None, None) for table in tables],
+                lambda job, chunk_size, origin: (
+                    fill_table_subset,
+                    origin,
+                    self.d_eng_conn,
+                    job[0],
+                    keys[job[0].name],
+                    chunk_size,
+                    token,
+                ),
+                chunk_size,
+                origins=origins,
+            )
+        finally:
+            if snap:
+                snap.close()
+
+        all_migrated = self.validate_subset(keys)
+        return self.__finish(
+            d_eng,
+            all_migrated,
+            copy_constraints,
+            copy_indexes,
+            internal_tables=(REJECTS_TABLE,),
+        )
+
+    def validate_subset(self, keys):
+        """
+        Checks destination row counts against the subset computed
+        by compute_closure.
+        """
+        d_eng = create_engine(self.d_eng_conn)
+        validated = True
+        with d_eng.connect() as d_s:
+            for table in self.__sorted_tables(d_eng):
+                expected = len(keys.get(table.name, ()))
+                d_count = d_s.execute(select(func.count()).select_from(table)).scalar()
+                if expected != d_count:
+                    logger.error(
+                        f"Row count mismatch for {table.name}: {expected} vs {d_count}"
+                    )
+                    validated = False
+        return validated
+
+    def __sorted_tables(self, d_eng):
+        """
+        Destination tables in FK dependency order, excluding those
+        in self.exclude_tables.
+        """
+        metadata = MetaData()
+        metadata.reflect(d_eng)
+        insp = inspect(d_eng)
+        all_tables_and_fks = insp.get_sorted_table_and_fkc_names()
+        return [
+            metadata.tables[table_name]
+            for table_name, _ in all_tables_and_fks
+            if table_name
+            and table_name.lower() not in self.exclude_tables
+            and table_name not in INTERNAL_TABLES
+        ]
+
+    def __run_jobs(
+        self,
+        d_eng,
+        jobs,
+        make_task,
+        chunk_size,
+        max_worker_memory=None,
+        max_tasks_per_child=None,
+        origins=None,
+        controller=None,
+        profile_dir=None,
+    ):
+        """
+        Runs table or (table, lo, hi) PK-range jobs in a process pool.
+        make_task(job, chunk_size, origin) returns the function to run
+        followed by its arguments.
+
+        Each job is placed on the origin with the best observed read latency.
+        Jobs failing because of their origin are moved to another one.
+
+        The pool is recycled once a worker ends a job above
+        max_worker_memory (bytes): new jobs go to a fresh pool while the
+        workers of the old one end their running jobs and exit, so no worker
+        idles waiting for the longest job. Workers are replaced after
+        max_tasks_per_child jobs, natively from Python 3.11 and by recycling
+        the pool after about max_tasks_per_child jobs per worker before.
+        Jobs whose worker died are retried in a fresh pool with half the
+        chunk size.
+
+        With a ConcurrencyController, only its limit of jobs run at the
+        same time, up to the pool size. With profile_dir, jobs run under
+        cProfile and write their stats there.
+        """
+        processes = 1 if d_eng.name == "sqlite" else self.n_cores
+        origins = OriginPool(origins or self.o_eng_conns, max_lag=self.max_replica_lag)
+        if len(origins.conn_strings) > 1:
+            origins.probe()
+
+        logger.info(
+            f"Starting data migration of {len(jobs)} jobs using {processes} "
+            f"processes and {len(origins.available)} origins"
+        )
+
+        pending = deque((job, chunk_size) for job in jobs)
+        attempts = {}
+
+        def retry(job, job_chunk_size, reason):
+            attempts[id(job)] = attempts.get(id(job), 0) + 1
+            if attempts[id(job)] >= self.MAX_TABLE_ATTEMPTS:
+                logger.error(f"{_job_name(job)} worker died: {reason}")
+                return False
+            logger.warning(
+                f"{_job_name(job)} worker died: {reason}. Retrying with chunk "
+                f"size {job_chunk_size}"
+            )
+            pending.appendleft((job, job_chunk_size))
+            return True
+
+        def new_pool():
+            kwargs = {}
+            if max_tasks_per_child and NATIVE_MAX_TASKS:
+                kwargs["max_tasks_per_child"] = max_tasks_per_child
+            return cf.ProcessPoolExecutor(
+                max_workers=processes,
+                initializer=worker_initializer,
+                initargs=worker_initargs(),
+                **kwargs,
+            )
+
+        # Pools being replaced, their workers exit as their jobs end
+        retired = []
+
+        def recycle(exe):
+            # Workers replaced natively can't be shut down while running:
+            # the pool would try to replace them after its shutdown
+            if not (max_tasks_per_child and NATIVE_MAX_TASKS):
+                exe.shutdown(wait=False)
+            retired.append(exe)
+            return new_pool()
+
+        exe = new_pool()
+        submitted = 0
+        futures = {}
+        try:
+            while pending or futures:
+                limit = controller.limit if controller else processes
+                while pending and len(futures) < limit:
+                    job, job_chunk_size = pending.popleft()
+                    origin = origins.pick()
+                    task = make_task(job, job_chunk_size, origin)
+                    # LOB passes are compared with each other, not with the
+                    # first pass of their table
+                    kind = (task[0].__name__, job[0].name)
+                    if profile_dir:
+                        task = (run_profiled, profile_dir, job[0].name, *task)
+                    future = exe.submit(run_task, *task)
+                    futures[future] = (job, job_chunk_size, origin, exe, kind)
+                    submitted += 1
+                    if (
+                        max_tasks_per_child
+                        and not NATIVE_MAX_TASKS
+                        and submitted >= max_tasks_per_child * processes
+                    ):
+                        exe = recycle(exe)
+                        submitted = 0
+                if not futures:
+                    break
+                done, _ = cf.wait(futures, return_when=cf.FIRST_COMPLETED)
+                for future in done:
+                    job, job_chunk_size, origin, pool, kind = futures.pop(future)
                     try:
-                        res = future.result()
-                        if not res:
-                            logger.error(f"Error copying table: {tbl}")
+                        out = future.result()
+                        origins.done(origin, out["read_latency"])
+                        if controller:
+                            controller.done(
+                                out["read_latency"],
+                                out["commit_latency"],
+                                out["chunks"],
+                                out["errors"],
+                                kind,
+                                out["values"],
+                            )
+                        if not out["result"]:
+                            logger.error(f"Error copying {_job_name(job)}")
+                        rss = out["rss"]
+                        if max_worker_memory and rss > max_worker_memory:
+                            logger.info(
+                                f"Worker RSS {rss / MB:.1f} MB above cap after "
+                                f"copying {_job_name(job)}, recycling workers"
+                            )
+                            if pool is exe:
+                                exe = recycle(exe)
+                                submitted = 0
+                    except cf.process.BrokenProcessPool as e:
+                        origins.release(origin)
+                        if controller:
+                            controller.failed()
+                        if retry(job, max(1, job_chunk_size // 2), e) and pool is exe:
+                            exe = recycle(exe)
+                            submitted = 0
                     except Exception as e:
-                        logger.error(f"Table {tbl} worker died: {e}")
+                        if controller:
+                            controller.failed()
+                        if is_transient(e) and len(origins.conn_strings) > 1:
+                            origins.failed(origin, running=True)
+                            retry(job, job_chunk_size, e)
+                        else:
+                            origins.release(origin)
+                            logger.error(f"{_job_name(job)} worker died: {e}")
+                for pool in retired[:]:
+                    if all(f[3] is not pool for f in futures.values()):
+                        pool.shutdown()
+                        retired.remove(pool)
+        finally:
+            for pool in retired + [exe]:
+                pool.shutdown()
 
-        # Validate row counts
-        all_migrated = not copy_data or self.validate_migration()
+    def optimize(self, vacuum=True, page_size=None):
+        """
+        Post-load maintenance of the destination tables, n_workers at the same
+        time: VACUUM (ANALYZE) on PostgreSQL, ANALYZE TABLE and OPTIMIZE TABLE
+        on MySQL, ANALYZE then a VACUUM of the whole file on SQLite.
 
+        Args:
+            vacuum (bool): Vacuum/optimize besides gathering statistics.
+            page_size (int): Page size of a SQLite destination.
+
+        Returns:
+            dict: Seconds spent per table.
+        """
+        d_eng = create_engine(self.d_eng_conn)
+        return optimize_tables(
+            self.d_eng_conn,
+            [table.name for table in self.__sorted_tables(d_eng)],
+            n_workers=self.n_cores,
+            vacuum=vacuum,
+            page_size=page_size,
+        )
+
+    def __finish(
+        self,
+        d_eng,
+        all_migrated,
+        copy_constraints,
+        copy_indexes,
+        optimize=False,
+        page_size=None,
+        internal_tables=(),
+    ):
+        """
+        Migrates constraints and indexes once the data is validated,
+        drops the internal_tables of the migration left in the destination,
+        then optimizes the tables if asked to.
+        """
         if all_migrated:
             logger.info("Row count validation successful")
             if copy_constraints and d_eng.name != "sqlite":
@@ -500,7 +1740,30 @@ class DbMigrator:
                 logger.info("Starting index migration")
                 self.__copy_indexes()
                 logger.info("Index migration completed")
+            self.__drop_internal_tables(d_eng, internal_tables)
+            if optimize:
+                self.optimize(page_size=page_size)
             logger.info("Database migration completed successfully")
         else:
             logger.error("Migration failed: row count validation unsuccessful")
         return all_migrated
+
+    def __drop_internal_tables(self, d_eng, names):
+        """
+        Drops the bookkeeping tables in names found in the destination,
+        keeping a rejects table that holds rejected rows.
+        """
+        metadata = MetaData()
+        metadata.reflect(d_eng, only=lambda name, _: name in names)
+        for table in metadata.tables.values():
+            if table.name == REJECTS_TABLE:
+                with d_eng.connect() as conn:
+                    q = select(func.count()).select_from(table)
+                    n_rejects = conn.execute(q).scalar()
+                if n_rejects:
+                    logger.warning(
+                        f"Keeping the {n_rejects} rejected rows in '{table.name}'"
+                    )
+                    continue
+            table.drop(d_eng)
+            logger.info(f"Dropped '{table.name}'")
@@ -0,0 +1,118 @@
+from sqlalchemy import create_engine, text
+import concurrent.futures as cf
+import time
+from .logs import logger
+
+
+def table_statements(dialect, table, vacuum=True):
+    """
+    Maintenance statements of a freshly loaded table, table being the
+    quoted table name.
+    """
+    if dialect == "postgresql":
+        return [f"VACUUM (ANALYZE) {table}" if vacuum else f"ANALYZE {table}"]
+    if dialect == "mysql":
+        return [f"ANALYZE TABLE {table}"] + (
+            [f"OPTIMIZE TABLE {table}"] if vacuum else []
+        )
+    if dialect == "sqlite":
+        return [f"ANALYZE {table}"]
+    if dialect == "oracle":
+        return [f"BEGIN DBMS_STATS.GATHER_TABLE_STATS(USER, '{table}'); END;"]
+    return []
+
+
+def optimize_table(d_eng_conn, table_name, vacuum=True):
+    """
+    Gathers planner statistics of a table and, with vacuum, sets its
+    visibility map (PostgreSQL) or defragments it (MySQL).
+
+    Returns:
+        float: Seconds spent.
+    """
+    d_eng = create_engine(d_eng_conn, isolation_level="AUTOCOMMIT")
+    if d_eng.name == "oracle":
+        table = table_name.upper()
+    else:
+        table = d_eng.dialect.identifier_preparer.quote(table_name)
+    ini = time.perf_counter()
+    with d_eng.connect() as conn:
+        for stmt in table_statements(d_eng.name, table, vacuum):
+            # MySQL reports errors of ANALYZE/OPTIMIZE as result rows
+            res = conn.execute(text(stmt))
+            if res.returns_rows:
+                for row in res.mappings():
+                    if row.get("Msg_type") == "error":
+                        logger.warning(f"{stmt}: {row.get('Msg_text')}")
+    elapsed = time.perf_counter() - ini
+    logger.info(f"Optimized table '{table_name}' in {elapsed:.2f}s")
+    return elapsed
+
+
+def vacuum_sqlite(d_eng_conn, page_size=None):
+    """
+    Rebuilds a SQLite file, with the given page size if any.
+
+    Returns:
+        float: Seconds spent.
+    """
+    d_eng = create_engine(d_eng_conn, isolation_level="AUTOCOMMIT")
+    ini = time.perf_counter()
+    with d_eng.connect() as conn:
+        if page_size:
+            conn.execute(text(f"PRAGMA page_size = {int(page_size)}"))
+        conn.execute(text("VACUUM"))
+    elapsed = time.perf_counter() - ini
+    logger.info(f"Vacuumed SQLite database in {elapsed:.2f}s")
+    return elapsed
+
+
+def optimize_tables(d_eng_conn, table_names, n_workers=4, vacuum=True, page_size=None):
+    """
+    Post-load maintenance of the destination: statistics and vacuum of
+    every table, n_workers tables at the same time. SQLite tables are done
+    one after the other, followed by a VACUUM of the whole file.
+
+    Args:
+        d_eng_conn (str): Destination DB connection string.
+        table_names (list[str]): Tables to optimize.
+        n_workers (int): Tables optimized at the same time.
+        vacuum (bool): Also vacuum (PostgreSQL, SQLite) or optimize (MySQL).
+        page_size (int): SQLite page size set before the VACUUM.
+
+    Returns:
+        dict: Seconds spent per table, None for the tables that failed,
+        and by the SQLite VACUUM under 'VACUUM'.
+    """
+    dialect = create_engine(d_eng_conn).name
+    if dialect == "sqlite":
+        n_workers = 1
+    logger.info(
+        f"Starting post-load optimization of {len(table_names)} tables "
+        f"using {n_workers} workers"
+    )
+    ini = time.perf_counter()
+    timings = {}
+    with cf.ThreadPoolExecutor(max_workers=n_workers) as exe:
+        futures = {
+            exe.submit(optimize_table, d_eng_conn, table_name, vacuum): table_name
+            for table_name in table_names
+        }
+        for future in cf.as_completed(futures):
+            table_name = futures[future]
+            try:
+                timings[table_name] = future.result()
+            except Exception as e:
+                logger.warning(f"Optimization of table '{table_name}' failed: {e}")
+                timings[table_name] = None
+    if dialect == "sqlite" and vacuum:
+        timings["VACUUM"] = vacuum_sqlite(d_eng_conn, page_size)
+
+    slowest = sorted(
+        ((t, name) for name, t in timings.items() if t is not None), reverse=True
+    )
+    logger.info(
+        f"Post-load optimization completed in {time.perf_counter() - ini:.2f}s, "
+        "slowest: " + ", ".join(f"{name} {t:.2f}s" for t, name in slowest[:10])
+    )
+    return timings
@@ -0,0 +1,187 @@
+from sqlalchemy import create_engine, literal, select, text
+from sqlalchemy.engine import make_url
+import time
+from .logs import logger
+
+# Queries returning the replication lag of a standby/replica, in seconds
+LAG_QUERIES = {
+    "postgresql": (
+        "SELECT CASE WHEN pg_is_in_recovery() THEN "
+        "EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) ELSE 0 END"
+    ),
+    "oracle": (
+        "SELECT NVL(MAX(EXTRACT(DAY FROM TO_DSINTERVAL(value)) * 86400 "
+        "+ EXTRACT(HOUR FROM TO_DSINTERVAL(value)) * 3600 "
+        "+ EXTRACT(MINUTE FROM TO_DSINTERVAL(value)) * 60 "
+        "+ EXTRACT(SECOND FROM TO_DSINTERVAL(value))), 0) "
+        "FROM v$dataguard_stats WHERE name = 'apply lag'"
+    ),
+}
+
+
+def replica_lag(eng):
+    """
+    Replication lag of an origin in seconds, 0 for a primary and None
+    when it can't be measured.
+    """
+    try:
+        with eng.connect() as conn:
+            if eng.name == "mysql":
+                row = conn.execute(text("SHOW REPLICA STATUS")).mappings().first()
+                if row is None:
+                    return 0
+                return row.get("Seconds_Behind_Source")
+            if eng.name in LAG_QUERIES:
+                return float(conn.execute(text(LAG_QUERIES[eng.name])).scalar() or 0)
+    except Exception as e:
+        logger.debug(f"Can't measure replication lag of {eng.url}: {e}")
+    return None
+
+
+class OriginPool:
+    """
+    Spreads origin reads across a primary and its read replicas.
+
+    Jobs are placed on the origin with the lowest observed read latency
+    weighted by the jobs already running on it, once every origin ran
+    MIN_SAMPLES jobs. Origins not reachable when probed, failing repeatedly,
+    much slower than the best one or lagging behind are excluded for the
+    rest of the run, the last available origin is never excluded.
+
+    Attributes:
+        conn_strings (list[str]): Origin connection strings, primary first.
+        latency (dict): EWMA of the chunk read latency of each origin, seconds.
+        running (dict): Jobs running on each origin.
+        excluded (set): Origins not used anymore.
+    """
+
+    # EWMA weight of new latency samples
+    ALPHA = 0.3
+    # Consecutive failures before excluding an origin
+    MAX_FAILURES = 3
+    # Samples needed before excluding an origin for being slow
+    MIN_SAMPLES = 3
+
+    def __init__(self, conn_strings, slow_factor=5.0, max_lag=None, lag_interval=30):
+        if isinstance(conn_strings, str):
+            conn_strings = [conn_strings]
+        self.conn_strings = list(conn_strings)
+        self.slow_factor = slow_factor
+        self.max_lag = max_lag
+        self.lag_interval = lag_interval
+        self.latency = {}
+        self.samples = {c: 0 for c in self.conn_strings}
+        self.failures = {c: 0 for c in self.conn_strings}
+        self.running = {c: 0 for c in self.conn_strings}
+        self.excluded = set()
+        self.last_lag_check = 0
+
+    @property
+    def available(self):
+        return [c for c in self.conn_strings if c not in self.excluded]
+
+    def probe(self):
+        """
+        Seeds the latency of every origin with a trivial query, excluding
+        the origins not reachable.
+        """
+        for conn_string in self.available:
+            ini = time.perf_counter()
+            try:
+                with create_engine(conn_string).connect() as conn:
+                    conn.execute(select(literal(1)))
+                self.latency[conn_string] = time.perf_counter() - ini
+            except Exception as e:
+                self.exclude(conn_string, f"not reachable: {e}")
+
+    def pick(self):
+        """
+        Origin to run the next job on, and marks the job as running there.
+        Origins with fewer than MIN_SAMPLES jobs measured are tried first, so
+        placement relies on real chunk reads rather than on the probe.
+        """
+        self.check_lag()
+        origin = min(
+            self.available,
+            key=lambda c: (
+                self.samples[c] >= self.MIN_SAMPLES,
+                self.latency.get(c, 0) * (self.running[c] + 1),
+            ),
+        )
+        self.running[origin] += 1
+        return origin
+
+    def release(self, origin):
+        """
+        Records a job no longer running on an origin.
+        """
+        self.running[origin] -= 1
+
+    def done(self, origin, latency=None):
+        """
+        Records a job finished on an origin and its mean chunk read latency.
+        """
+        self.release(origin)
+        self.failures[origin] = 0
+        if latency is None:
+            return
+        prev = self.latency.get(origin)
+        self.latency[origin] = (
+            latency if prev is None else self.ALPHA * latency + (1 - self.ALPHA) * prev
+        )
+        self.samples[origin] += 1
+        if self.samples[origin] < self.MIN_SAMPLES:
+            return
+        best = min(
+            self.latency[c]
+            for c in self.available
+            if self.samples[c] >= self.MIN_SAMPLES
+        )
+        if self.latency[origin] > self.slow_factor * best:
+            self.exclude(
+                origin,
+                f"read latency {self.latency[origin]:.3f}s vs {best:.3f}s "
+                f"on the best origin",
+            )
+
+    def failed(self, origin, running=False):
+        """
+        Records a job failed on an origin because of it.
+        """
+        if running:
+            self.release(origin)
+        self.failures[origin] += 1
+        if self.failures[origin] >= self.MAX_FAILURES:
+            self.exclude(origin, f"{self.failures[origin]} consecutive failures")
+
+    def check_lag(self):
+        """
+        Excludes the origins lagging more than max_lag seconds,
+        at most every lag_interval seconds.
+        """
+        if not self.max_lag or len(self.conn_strings) < 2:
+            return
+        now = time.time()
+        if now - self.last_lag_check < self.lag_interval:
+            return
+        self.last_lag_check = now
+        for conn_string in self.available:
+            lag = replica_lag(create_engine(conn_string))
+            if lag is not None and lag > self.max_lag:
+                self.exclude(conn_string, f"replication lag of {lag:.0f}s")
+
+    def exclude(self, origin, reason):
+        if origin in self.excluded or len(self.available) < 2:
+            return
+        self.excluded.add(origin)
+        logger.warning(f"Excluding origin {_safe(origin)}: {reason}")
+
+
+def _safe(conn_string):
+    """
+    Connection string without its password, for logging.
+    """
+    try:
+        return make_url(conn_string).render_as_string(hide_password=True)
+    except Exception:
+        return "<origin>"
@@ -0,0 +1,248 @@
+from sqlalchemy import (
+    Boolean,
+    Column,
+    MetaData,
+    Table,
+    and_,
+    literal_column,
+    select,
+    text,
+    true,
+)
+from sqlalchemy.types import BigInteger, Integer, String
+import json
+from .logs import logger
+
+UNITS_TABLE = "cbl_migrator_units"
+
+# Origin dialects whose rows can be read by physical location
+PHYSICAL_DIALECTS = ("oracle", "postgresql", "sqlite")
+
+# User extents of a table as ROWID ranges, like DBMS_PARALLEL_EXECUTE chunks
+ORACLE_EXTENTS = """
+SELECT e.relative_fno, e.block_id, e.blocks, o.data_object_id
+FROM user_extents e
+JOIN user_objects o
+  ON o.object_name = e.segment_name
+  AND NVL(o.subobject_name, '-') = NVL(e.partition_name, '-')
+WHERE e.segment_name = :table_name AND o.object_type LIKE 'TABLE%'
+ORDER BY o.data_object_id, e.relative_fno, e.block_id
+"""
+
+ORACLE_ROWID = (
+    "SELECT DBMS_ROWID.ROWID_CREATE(1, :obj, :fno, :lo_block, 0), "
+    "DBMS_ROWID.ROWID_CREATE(1, :obj, :fno, :hi_block, 32767) FROM dual"
+)
+
+
+def _rows_per_block(conn, dialect, table_name):
+    """
+    Average rows per block from the optimizer statistics, 1 when the
+    table was never analyzed.
+    """
+    if dialect == "postgresql":
+        q = text("SELECT reltuples, relpages FROM pg_class WHERE oid = to_regclass(:t)")
+    else:
+        q = text("SELECT num_rows, blocks FROM user_tables WHERE table_name = :t")
+    row = conn.execute(q, {"t": table_name}).first()
+    if not row or not row[0] or not row[1] or row[0] < 0:
+        return 1
+    return max(1, int(row[0] / row[1]))
+
+
+def physical_units(o_eng, table, range_size):
+    """
+    Splits a table into ranges of about range_size rows by physical row
+    location, each read with a sequential scan:
+
+    - SQLite: rowid ranges, lo <= rowid < hi.
+    - PostgreSQL: ctid block ranges, blocks lo <= block < hi.
+    - Oracle: ROWID ranges of (parts of) the table extents, lo <= ROWID <= hi.
+
+    Returns:
+        list[tuple]: (lo, hi) ranges, lo/hi None for open ends.
+    """
+    with o_eng.connect() as conn:
+        if o_eng.name == "sqlite":
+            rowid = literal_column("rowid")
+            res = conn.execution_options(stream_results=True).execute(
+                select(rowid).select_from(table).order_by(rowid)
+            )
+            bounds = [row[0] for i, row in enumerate(res) if i and i % range_size == 0]
+            return list(zip([None] + bounds, bounds + [None]))
+
+        table_name = table.name
+        if o_eng.name == "postgresql":
+            table_name = o_eng.dialect.identifier_preparer.format_table(table)
+        elif o_eng.name == "oracle":
+            table_name = o_eng.dialect.denormalize_name(table.name)
+        step = max(1, range_size // _rows_per_block(conn, o_eng.name, table_name))
+
+        if o_eng.name == "postgresql":
+            n_blocks = conn.execute(
+                text(
+                    "SELECT pg_relation_size(to_regclass(:t)) "
+                    "/ current_setting('block_size')::int"
+                ),
+                {"t": table_name},
+            ).scalar()
+            bounds = list(range(step, n_blocks or 0, step))
+            return list(zip([None] + bounds, bounds + [None]))
+
+        units = []
+        extents = conn.execute(text(ORACLE_EXTENTS), {"table_name": table_name})
+        for fno, block_id, blocks, obj in extents.all():
+            for lo_block in range(block_id, block_id + blocks, step):
+                hi_block = min(lo_block + step, block_id + blocks) - 1
+                units.append(
+                    tuple(
+                        conn.execute(
+                            text(ORACLE_ROWID),
+                            {
+                                "obj": obj,
+                                "fno": fno,
+                                "lo_block": lo_block,
+                                "hi_block": hi_block,
+                            },
+                        ).one()
+                    )
+                )
+        # Tables without segment yet
+        return units or [(None, None)]
+
+
+def physical_range(dialect, lo, hi):
+    """
+    Clause selecting the rows of a range from physical_units.
+    """
+    if lo is None and hi is None:
+        return true()
+    if dialect == "oracle":
+        return text("ROWID BETWEEN CHARTOROWID(:lo) AND CHARTOROWID(:hi)").bindparams(
+            lo=lo, hi=hi
+        )
+    clauses = []
+    if dialect == "postgresql":
+        if lo is not None:
+            clauses.append(text(f"ctid >= '({int(lo)},0)'::tid"))
+        if hi is not None:
+            clauses.append(text(f"ctid < '({int(hi)},0)'::tid"))
+    else:
+        rowid = literal_column("rowid")
+        if lo is not None:
+            clauses.append(rowid >= lo)
+        if hi is not None:
+            clauses.append(rowid < hi)
+    return and_(*clauses)
+
+
+class UnitLog:
+    """
+    Physical ranges of the tables of a migration, kept in the destination.
+
+    Ranges are planned once per table and stored, so a resumed migration
+    reads the same ones even if the statistics they come from changed. A
+    range is marked done in the transaction inserting its rows, so it is
+    copied exactly once, also for tables without PK whose copied rows
+    can't be told apart.
+
+    Attributes:
+        table (Table): The units table.
+    """
+
+    def __init__(self, d_eng):
+        self.eng = d_eng
+        self.table = Table(
+            UNITS_TABLE,
+            MetaData(),
+            Column("table_name", String(128), primary_key=True),
+            Column("unit_id", Integer, primary_key=True, autoincrement=False),
+            # Range bounds, JSON encoded, null for open ends
+            Column("lo", String(4000)),
+            Column("hi", String(4000)),
+            Column("done", Boolean, nullable=False),
+            Column("rows", BigInteger),
+        )
+        self.table.metadata.create_all(d_eng)
+
+    def __unit(self, table_name, lo, hi):
+        t = self.table
+        return and_(
+            t.c.table_name == table_name,
+            t.c.lo == (None if lo is None else json.dumps(lo)),
+            t.c.hi == (None if hi is None else json.dumps(hi)),
+        )
+
+    def plan(self, table_name, make_units):
+        """
+        Ranges of a table, planned by make_units() the first time.
+        """
+        t = self.table
+        with self.eng.begin() as conn:
+            rows = conn.execute(
+                select(t.c.lo, t.c.hi)
+                .where(t.c.table_name == table_name)
+                .order_by(t.c.unit_id)
+            ).all()
+            if rows:
+                logger.info(
+                    f"Reusing the {len(rows)} ranges planned for '{table_name}'"
+                )
+                return [
+                    tuple(None if v is None else json.loads(v) for v in row)
+                    for row in rows
+                ]
+            units = make_units()
+            conn.execute(
+                t.insert(),
+                [
+                    {
+                        "table_name": table_name,
+                        "unit_id": unit_id,
+                        "lo": None if lo is None else json.dumps(lo),
+                        "hi": None if hi is None else json.dumps(hi),
+                        "done": False,
+                    }
+                    for unit_id, (lo, hi) in enumerate(units)
+                ],
+            )
+        return units
+
+    def planned(self, table_name):
+        """
+        Whether ranges were planned for a table.
+        """
+        t = self.table
+        with self.eng.connect() as conn:
+            q = select(t.c.unit_id).where(t.c.table_name == table_name).limit(1)
+            return conn.execute(q).first() is not None
+
+    def rows(self, table_name, lo, hi):
+        """
+        Rows copied by a range, None if it is not done.
+        """
+        t = self.table
+        with self.eng.connect() as conn:
+            row = conn.execute(
+                select(t.c.done, t.c.rows).where(self.__unit(table_name, lo, hi))
+            ).first()
+        return row.rows if row and row.done else None
+
+    def done(self, conn, table_name, lo, hi, rows):
+        """
+        Marks a range as done within the transaction of conn.
+        """
+        conn.execute(
+            self.table.update()
+            .where(self.__unit(table_name, lo, hi))
+            .values(done=True, rows=rows)
+        )
+
+    def forget(self, table_name):
+        """
+        Drops the ranges planned for a table, planned again on next use.
+        """
+        with self.eng.begin() as conn:
+            conn.execute(
+                self.table.delete().where(self.table.c.table_name == table_name)
+            )
@@ -0,0 +1,112 @@
+import cProfile
+import glob
+import io
+import os
+import pstats
+import time
+from .logs import logger
+
+# Where the time of a function goes, by the path of its module
+CATEGORIES = [
+    ("statement compilation", ("sqlalchemy/sql/",)),
+    ("network waits", ("socket", "ssl", "selectors", "<method 'recv")),
+    (
+        "driver fetch/execute",
+        ("sqlite3", "oracledb", "cx_Oracle", "psycopg", "MySQLdb", "pymysql"),
+    ),
+    ("value conversion and row rebuild", ("cbl_migrator/conv.py",)),
+    ("sqlalchemy execution", ("sqlalchemy/",)),
+    ("migrator", ("cbl_migrator/",)),
+]
+
+
+def run_profiled(profile_dir, name, func, *args):
+    """
+    Runs func under cProfile and writes its stats to profile_dir,
+    in a file per task named after name.
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        os.makedirs(profile_dir, exist_ok=True)
+        profiler.dump_stats(
+            os.path.join(
+                profile_dir, f"{name}.{os.getpid()}.{time.monotonic_ns()}.prof"
+            )
+        )
+
+
+def clear_profiles(profile_dir):
+    """
+    Removes the stats left by a previous run.
+    """
+    for path in glob.glob(os.path.join(profile_dir, "*.prof")):
+        os.remove(path)
+
+
+def _category(func):
+    filename, _, name = func
+    where = f"{filename}:{name}"
+    for category, patterns in CATEGORIES:
+        if any(p in where for p in patterns):
+            return category
+    return "other"
+
+
+def report_profiles(profile_dir, top=30):
+    """
+    Merges the stats of all the tasks into profile_dir/merged.pstats and
+    writes a ranked hotspot report to profile_dir/hotspots.txt: time per
+    table, time per category (statement compilation, driver, network,
+    value conversion...) and the functions with the highest own time.
+
+    Returns:
+        str: Path of the report, None if there were no stats.
+    """
+    paths = sorted(glob.glob(os.path.join(profile_dir, "*.prof")))
+    if not paths:
+        return None
+
+    by_table = {}
+    for path in paths:
+        table = os.path.basename(path).rsplit(".", 3)[0]
+        by_table[table] = by_table.get(table, 0) + pstats.Stats(path).total_tt
+    stats = pstats.Stats(*paths)
+    stats.dump_stats(os.path.join(profile_dir, "merged.pstats"))
+
+    by_category = {}
+    for func, (_, _, tottime, _, _) in stats.stats.items():
+        category = _category(func)
+        by_category[category] = by_category.get(category, 0) + tottime
+
+    out = io.StringIO()
+    out.write(f"Profiled {len(paths)} tasks, {stats.total_tt:.2f}s in total\n\n")
+    out.write("Time per table:\n")
+    for table, seconds in sorted(by_table.items(), key=lambda x: -x[1]):
+        out.write(f"  {seconds:10.2f}s  {table}\n")
+    out.write("\nTime per category:\n")
+    # cProfile doesn't record calls to types like zip or dict
+    out.write(
+        "  (building the row dicts is counted in the own time of the\n"
+        "  converter functions calling zip/dict, under value conversion)\n"
+    )
+    for category, seconds in sorted(by_category.items(), key=lambda x: -x[1]):
+        share = seconds / stats.total_tt if stats.total_tt else 0
+        out.write(f"  {seconds:10.2f}s  {share:6.1%}  {category}\n")
+    out.write("\nHotspots:\n")
+    stats.stream = out
+    stats.sort_stats("tottime").print_stats(top)
+
+    path = os.path.join(profile_dir, "hotspots.txt")
+    with open(path, "w") as f:
+        f.write(out.getvalue())
+    logger.info(
+        "Profile hotspots: "
+        + ", ".join(
+            f"{category} {seconds:.2f}s"
+            for category, seconds in sorted(by_category.items(), key=lambda x: -x[1])
+        )
+        + f". Report in {path}"
+    )
+    return path
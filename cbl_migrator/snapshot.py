@@ -0,0 +1,101 @@
+from sqlalchemy import event, text
+from .logs import logger
+
+
+class Snapshot:
+    """
+    A point in time of the origin captured by the coordinator, shared with
+    every worker so all the chunks are read at that same point.
+
+    - Oracle: the current SCN. Workers enable flashback at that SCN for their
+      sessions (DBMS_FLASHBACK), the session-wide form of AS OF SCN queries.
+    - PostgreSQL: a snapshot exported with pg_export_snapshot(). The exporting
+      transaction is kept open until close() is called, workers import it
+      with SET TRANSACTION SNAPSHOT in REPEATABLE READ transactions.
+    - MySQL: snapshots can't be shared between sessions, every read
+      transaction is started WITH CONSISTENT SNAPSHOT instead.
+
+    Attributes:
+        token (dict): Picklable description of the snapshot, for apply_snapshot.
+    """
+
+    def __init__(self, o_eng):
+        self.conn = None
+        self.token = {"dialect": o_eng.name}
+        if o_eng.name == "oracle":
+            with o_eng.connect() as conn:
+                scn = conn.execute(
+                    text("SELECT dbms_flashback.get_system_change_number FROM dual")
+                ).scalar()
+            self.token["scn"] = int(scn)
+            logger.info(f"Reading origin as of SCN {scn}")
+        elif o_eng.name == "postgresql":
+            self.conn = o_eng.connect().execution_options(
+                isolation_level="REPEATABLE READ"
+            )
+            self.conn.begin()
+            snapshot_id = self.conn.execute(
+                text("SELECT pg_export_snapshot()")
+            ).scalar()
+            self.token["snapshot_id"] = snapshot_id
+            logger.info(f"Reading origin at exported snapshot {snapshot_id}")
+        elif o_eng.name == "mysql":
+            logger.warning(
+                "MySQL can't share a snapshot between sessions, each read "
+                "transaction uses its own consistent snapshot"
+            )
+        else:
+            logger.warning(f"Snapshot reads not supported for {o_eng.name}")
+
+    @property
+    def shareable(self):
+        """
+        Whether the snapshot can also be read from replicas.
+        PostgreSQL exported snapshots only exist in the exporting server.
+        """
+        return self.token["dialect"] != "postgresql"
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.rollback()
+            self.conn.close()
+            self.conn = None
+
+
+def apply_snapshot(o_eng, token):
+    """
+    Makes every read of an origin engine happen at the snapshot
+    described by token.
+    """
+    if not token or token["dialect"] != o_eng.name:
+        return
+
+    if o_eng.name == "oracle":
+        scn = token["scn"]
+
+        @event.listens_for(o_eng, "connect")
+        def connect(dbapi_conn, conn_record):
+            cursor = dbapi_conn.cursor()
+            cursor.execute(
+                "BEGIN DBMS_FLASHBACK.ENABLE_AT_SYSTEM_CHANGE_NUMBER(:scn); END;",
+                scn=scn,
+            )
+            cursor.close()
+
+    elif o_eng.name == "postgresql":
+        snapshot_id = token["snapshot_id"]
+
+        @event.listens_for(o_eng, "begin")
+        def begin(conn):
+            cursor = conn.connection.cursor()
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cursor.execute(f"SET TRANSACTION SNAPSHOT '{snapshot_id}'")
+            cursor.close()
+
+    elif o_eng.name == "mysql":
+
+        @event.listens_for(o_eng, "begin")
+        def begin(conn):
+            cursor = conn.connection.cursor()
+            cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY")
+            cursor.close()
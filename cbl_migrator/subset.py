@@ -0,0 +1,189 @@
+from collections import defaultdict, deque
+from sqlalchemy.sql import select
+from sqlalchemy import create_engine, func, text, tuple_
+from .conv import compile_value_converter, set_output_type_handler
+from .snapshot import apply_snapshot
+from .logs import logger
+
+
+def _batches(values, size):
+    values = list(values)
+    for ini in range(0, len(values), size):
+        yield values[ini : ini + size]
+
+
+def _in(cols, batch):
+    """
+    IN clause over one or several columns for a batch of value tuples.
+    """
+    if len(cols) == 1:
+        return cols[0].in_([v[0] for v in batch])
+    return tuple_(*cols).in_(batch)
+
+
+def _fetch_in(conn, out_cols, cols, values, chunk_size):
+    """
+    Returns the distinct out_cols tuples of rows whose cols are in values,
+    pushing the values down in batches of chunk_size.
+    """
+    found = set()
+    for batch in _batches(values, chunk_size):
+        q = select(*out_cols).where(_in(cols, batch))
+        for row in conn.execute(q):
+            found.add(tuple(row))
+    return found
+
+
+def _sample_keys(conn, table, predicate, sample_pct):
+    """
+    PKs of the root table rows matching the predicate, evenly sampled
+    by PK order when sample_pct is given.
+    """
+    pks = list(table.primary_key.columns)
+    q = select(*pks).order_by(*pks)
+    if predicate:
+        q = q.where(text(predicate))
+    keys = set()
+    for i, row in enumerate(conn.execute(q)):
+        if sample_pct is None or int((i + 1) * sample_pct / 100) != int(
+            i * sample_pct / 100
+        ):
+            keys.add(tuple(row))
+    return keys
+
+
+def _names(cols):
+    return [c.name for c in cols]
+
+
+def compute_closure(
+    o_eng,
+    metadata,
+    roots,
+    sample_pct=None,
+    include_children=False,
+    exclude_tables=(),
+    chunk_size=1000,
+):
+    """
+    Computes the FK-consistent set of PKs to copy for each table.
+
+    Starts from the root tables rows (filtered by predicate and/or sampled),
+    then walks the FK graph pulling the referenced parent rows. If
+    include_children is set, rows referencing the roots (and their children)
+    are pulled too, along with their own parents.
+
+    Args:
+        o_eng: Origin engine.
+        metadata (MetaData): Reflected origin metadata.
+        roots (dict[str, str]): Root table names and SQL predicates (or None).
+        sample_pct (float): Percentage of the root rows to keep.
+        include_children (bool): Also follow FKs from children to roots.
+        exclude_tables (list[str]): Lowercase names of tables to ignore.
+        chunk_size (int): Size of the IN batches.
+
+    Returns:
+        dict[str, set[tuple]]: PK tuples per table name.
+    """
+    tables = {
+        name: table
+        for name, table in metadata.tables.items()
+        if name.lower() not in exclude_tables
+    }
+    children = defaultdict(list)
+    for table in tables.values():
+        for fk in table.foreign_key_constraints:
+            if fk.referred_table.name in tables:
+                children[fk.referred_table.name].append((table, fk))
+
+    keys = defaultdict(set)
+    queue = deque()
+    with o_eng.connect() as conn:
+        for name, predicate in roots.items():
+            if name not in tables:
+                raise Exception(f"Subset root table {name} not available")
+            new = _sample_keys(conn, tables[name], predicate, sample_pct)
+            new -= keys[name]
+            keys[name].update(new)
+            queue.append((name, new, True))
+
+        while queue:
+            name, new, expand_children = queue.popleft()
+            if not new:
+                continue
+            table = tables[name]
+            pks = list(table.primary_key.columns)
+
+            # Parents referenced by the new rows
+            for fk in table.foreign_key_constraints:
+                parent = fk.referred_table
+                if parent.name not in tables:
+                    continue
+                cols = [e.parent for e in fk.elements]
+                ref_cols = [e.column for e in fk.elements]
+                values = _fetch_in(conn, cols, pks, new, chunk_size)
+                values = {v for v in values if None not in v}
+                parent_pks = list(parent.primary_key.columns)
+                if _names(ref_cols) != _names(parent_pks):
+                    values = _fetch_in(conn, parent_pks, ref_cols, values, chunk_size)
+                added = values - keys[parent.name]
+                if added:
+                    keys[parent.name].update(added)
+                    queue.append((parent.name, added, False))
+
+            # Children referencing the new rows
+            if not expand_children:
+                continue
+            for child, fk in children[name]:
+                cols = [e.parent for e in fk.elements]
+                ref_cols = [e.column for e in fk.elements]
+                values = new
+                if _names(ref_cols) != _names(pks):
+                    values = _fetch_in(conn, ref_cols, pks, new, chunk_size)
+                child_pks = list(child.primary_key.columns)
+                found = _fetch_in(conn, child_pks, cols, values, chunk_size)
+                added = found - keys[child.name]
+                if added:
+                    keys[child.name].update(added)
+                    queue.append((child.name, added, True))
+
+    for name, table_keys in keys.items():
+        logger.info(f"Subset of '{name}': {len(table_keys)} rows")
+    return dict(keys)
+
+
+def fill_table_subset(o_eng_conn, d_eng_conn, table, keys, chunk_size, snapshot=None):
+    """
+    Fills existing table in the destination with the origin rows whose PK
+    is in keys. Each batch replaces the rows already copied, so it is safe
+    to run it again after a failure.
+    """
+    logger.info(
+        f"Starting subset migration of table '{table.name}' ({len(keys)} rows)"
+    )
+    d_eng = create_engine(d_eng_conn)
+    o_eng = create_engine(o_eng_conn)
+    set_output_type_handler(o_eng)
+    apply_snapshot(o_eng, snapshot)
+    convert = compile_value_converter(table)
+
+    pks = list(table.primary_key.columns)
+    with d_eng.connect() as conn:
+        d_count = conn.execute(select(func.count()).select_from(table)).scalar()
+    if d_count == len(keys):
+        logger.info(
+            f"Table '{table.name}' already matches subset row count ({d_count} rows). Skipping."
+        )
+        return True
+
+    for batch in _batches(sorted(keys), chunk_size):
+        with o_eng.connect() as connr:
+            res = connr.execute(select(table).where(_in(pks, batch)))
+            data = res.all()
+        with d_eng.begin() as conn:
+            conn.execute(table.delete().where(_in(pks, batch)))
+            if data:
+                conn.execute(table.insert(), convert(list(res.keys()), data))
+
+    logger.info(f"Successfully completed subset migration of table '{table.name}'")
+    return True
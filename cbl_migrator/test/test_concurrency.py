@@ -0,0 +1,71 @@
+from ..concurrency import ConcurrencyController
+
+
+def test_additive_increase():
+    ctl = ConcurrencyController(4, min_workers=1)
+    assert ctl.limit == 1
+    for _ in range(5):
+        ctl.done(read_latency=0.1, commit_latency=0.1, chunks=10)
+    assert ctl.limit == 4
+
+
+def test_multiplicative_decrease():
+    ctl = ConcurrencyController(8, min_workers=2, initial=8, read_latency_slo=0.5)
+    # one decrease per window of limit jobs
+    for _ in range(8):
+        ctl.done(read_latency=2.0, chunks=10)
+    assert ctl.limit == 4
+    for _ in range(4):
+        ctl.done(read_latency=2.0, chunks=10)
+    assert ctl.limit == 2
+    for _ in range(4):
+        ctl.done(read_latency=2.0, chunks=10)
+    assert ctl.limit == 2
+
+
+def test_relative_slo_and_errors():
+    ctl = ConcurrencyController(4, initial=4)
+    for _ in range(4):
+        ctl.done(commit_latency=0.1, chunks=10)
+    assert ctl.limit == 4
+    # commit latency drifting above twice the best one
+    ctl.done(commit_latency=1.0, chunks=10)
+    assert ctl.limit == 2
+    ctl.done(commit_latency=1.0, chunks=10)
+    assert ctl.limit == 2
+    ctl.done(commit_latency=1.0, chunks=10)
+    assert ctl.limit == 1
+
+    ctl = ConcurrencyController(4, initial=4)
+    for _ in range(4):
+        ctl.failed()
+    assert ctl.limit == 2
+
+
+def test_tables_of_different_widths():
+    ctl = ConcurrencyController(4, initial=1)
+    # a narrow table first, then chunks of a wide one ten times slower
+    for _ in range(3):
+        ctl.done(read_latency=0.01, commit_latency=0.01, chunks=10, table="narrow")
+    for _ in range(3):
+        ctl.done(read_latency=0.1, commit_latency=0.1, chunks=10, table="wide")
+        ctl.done(read_latency=0.01, commit_latency=0.01, chunks=10, table="narrow")
+    assert ctl.limit == 4
+
+    # the wide table slowing down does breach the SLO
+    for _ in range(2):
+        ctl.done(read_latency=0.5, commit_latency=0.1, chunks=10, table="wide")
+    assert ctl.limit == 2
+
+
+def test_single_job_tables():
+    ctl = ConcurrencyController(4, initial=4)
+    # one job per table, compared per chunk value as no table has a baseline
+    for i in range(4):
+        ctl.done(read_latency=0.01, chunks=10, table=f"t{i}", values=1000)
+    assert ctl.limit == 4
+    # a table twice as wide is not slower per value
+    ctl.done(read_latency=0.02, chunks=10, table="wide", values=2000)
+    assert ctl.limit == 4
+    ctl.done(read_latency=0.1, chunks=10, table="slow", values=1000)
+    assert ctl.limit == 2
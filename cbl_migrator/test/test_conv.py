@@ -0,0 +1,92 @@
+from decimal import Decimal
+from sqlalchemy import Column, MetaData, Table
+from sqlalchemy.types import BigInteger, Float, Numeric, String, Text
+from ..conv import compile_value_converter
+
+
+class FakeLob:
+    def __init__(self, value):
+        self.value = value
+
+    def read(self):
+        return self.value
+
+
+def test_value_converter():
+    table = Table(
+        "t",
+        MetaData(),
+        Column("id", BigInteger, primary_key=True),
+        Column("mw", Float),
+        Column("price", Numeric(10, 2)),
+        Column("name", String(10)),
+        Column("molblock", Text),
+    )
+    convert = compile_value_converter(table)
+    keys = ["id", "mw", "price", "name", "molblock"]
+    rows = [
+        (Decimal(1), Decimal("1.5"), Decimal("2.25"), "a", FakeLob("M  END")),
+        (Decimal(2), None, None, "b", None),
+    ]
+    res = convert(keys, rows)
+    assert res == [
+        {"id": 1, "mw": 1.5, "price": Decimal("2.25"), "name": "a", "molblock": "M  END"},
+        {"id": 2, "mw": None, "price": None, "name": "b", "molblock": None},
+    ]
+    assert type(res[0]["id"]) is int
+    assert type(res[0]["mw"]) is float
+    assert convert(keys, []) == []
+
+
+def test_converter_registry(monkeypatch):
+    from sqlalchemy.types import Integer
+    from sqlalchemy.dialects.oracle import NUMBER
+    from .. import conv
+
+    class EntryPoint:
+        name = "postgresql.sqlite"
+        value = "pkg:pg2sqlite"
+
+        def load(self):
+            return conv.sqlite2sqlite
+
+    class EntryPoints(list):
+        def select(self, group):
+            return self if group == conv.ENTRY_POINT_GROUP else []
+
+    monkeypatch.setattr(conv, "COLTYPE_CONV", {"oracle": {"sqlite": conv.ora2sqlite}})
+    monkeypatch.setattr(conv, "_entry_points_loaded", False)
+    monkeypatch.setattr(
+        conv.metadata, "entry_points", lambda: EntryPoints([EntryPoint()])
+    )
+
+    assert conv.get_converter("oracle", "sqlite") is conv.ora2sqlite
+    assert not conv._entry_points_loaded
+    assert conv.get_converter("postgresql", "sqlite") is conv.sqlite2sqlite
+    try:
+        conv.get_converter("mysql", "sqlite")
+        assert False
+    except Exception as e:
+        assert "not available" in str(e)
+
+    assert conv.generic_type(NUMBER) is Numeric
+    assert conv.generic_type(Integer) is Integer
+
+
+def test_lazy_dialects():
+    import subprocess
+    import sys
+
+    out = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, cbl_migrator.migrator; "
+            "print(any(m.startswith(('sqlalchemy.dialects.oracle', "
+            "'sqlalchemy.dialects.mysql')) for m in sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert out.stdout.strip() == "False"
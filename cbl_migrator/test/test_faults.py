@@ -0,0 +1,111 @@
+from sqlalchemy import Column, MetaData, Table, create_engine, func, select, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.types import Integer, String
+from ..faults import (
+    RejectSink,
+    clear_rejects,
+    count_rejects,
+    insert_rows,
+    is_transient,
+    with_retries,
+)
+import pytest
+import sqlite3
+
+
+def make_table():
+    metadata = MetaData()
+    table = Table(
+        "compound",
+        metadata,
+        Column("cid", Integer, primary_key=True),
+        Column("inchi_key", String(27), unique=True),
+    )
+    eng = create_engine("sqlite://")
+    metadata.create_all(eng)
+    return eng, table
+
+
+def test_bisect_rejects(tmp_path):
+    eng, table = make_table()
+    rows = [{"cid": i, "inchi_key": f"KEY{i}"} for i in range(1, 11)]
+    rows[6]["inchi_key"] = "KEY3"
+    rejects = RejectSink(str(tmp_path), table)
+    insert_rows(eng, table, rows, rejects)
+
+    with eng.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(table)).scalar() == 9
+    assert count_rejects(str(tmp_path), "compound") == 1
+
+    # a row rejected again is only recorded once
+    insert_rows(eng, table, [rows[6]], RejectSink(str(tmp_path), table))
+    assert count_rejects(str(tmp_path), "compound") == 1
+
+
+def test_duplicate_pk_raises(tmp_path):
+    eng, table = make_table()
+    insert_rows(eng, table, [{"cid": 1, "inchi_key": "A"}])
+    # a row copied twice is not refused by the destination
+    rows = [{"cid": 1, "inchi_key": "A"}, {"cid": 2, "inchi_key": "B"}]
+    with pytest.raises(IntegrityError):
+        insert_rows(eng, table, rows, RejectSink(str(tmp_path), table))
+    assert count_rejects(str(tmp_path), "compound") == 0
+
+
+def test_db_rejects(tmp_path):
+    eng, table = make_table()
+    reject_db = f"sqlite:///{tmp_path / 'lease.db'}"
+    rows = [{"cid": i, "inchi_key": "KEY"} for i in range(1, 5)]
+    insert_rows(eng, table, rows, RejectSink(reject_db, table))
+    assert count_rejects(reject_db, "compound") == 3
+
+    # seen by any other worker or the coordinator
+    assert RejectSink(reject_db, table).pks == {(2,), (3,), (4,)}
+    assert clear_rejects(reject_db, "compound") == 3
+    assert count_rejects(reject_db, "compound") == 0
+
+
+def test_no_rejects_raises():
+    eng, table = make_table()
+    rows = [{"cid": 1, "inchi_key": "A"}, {"cid": 2, "inchi_key": "A"}]
+    with pytest.raises(IntegrityError):
+        insert_rows(eng, table, rows)
+
+
+def test_transient_retry():
+    eng, _ = make_table()
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise OperationalError(
+                "select 1",
+                {},
+                Exception("connection lost"),
+                connection_invalidated=True,
+            )
+        return "ok"
+
+    assert with_retries(flaky, eng, backoff=0) == "ok"
+    assert len(calls) == 3
+
+
+def test_is_transient():
+    eng, table = make_table()
+    for stmt in ("SELEC 1", "SELECT * FROM missing"):
+        with pytest.raises(OperationalError) as exc:
+            with eng.connect() as conn:
+                conn.execute(text(stmt))
+        assert not is_transient(exc.value)
+    assert is_transient(
+        OperationalError("insert", {}, sqlite3.OperationalError("database is locked"))
+    )
+
+    class MySQLError(Exception):
+        __module__ = "pymysql.err"
+
+    # deadlock vs check constraint violation
+    assert is_transient(OperationalError("insert", {}, MySQLError(1213, "Deadlock")))
+    assert not is_transient(OperationalError("insert", {}, MySQLError(3819, "Check")))
+    assert not is_transient(ValueError("bad value"))
@@ -0,0 +1,70 @@
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, func, select
+from ..faults import CopyAborted
+from ..lease import LeaseTable
+from ..migrator import fill_range
+from ..worker import _heartbeat
+import pytest
+import threading
+
+
+def test_lease_takeover(tmp_path):
+    conn = f"sqlite:///{tmp_path / 'lease.db'}"
+    lease = LeaseTable(conn, lease_seconds=60)
+    lease.publish([("compound", None, 10), ("compound", 10, None)])
+
+    assert lease.claim("a") == (0, "compound", None, 10)
+    assert lease.claim("b") == (1, "compound", 10, None)
+    assert lease.claim("c") is None
+
+    # an expired lease is taken over and the old owner can't complete it
+    expired = LeaseTable(conn, lease_seconds=-1)
+    assert expired.heartbeat(0, "a")
+    assert lease.claim("c") == (0, "compound", None, 10)
+    assert not lease.complete(0, "a", 10)
+    assert lease.complete(0, "c", 10)
+
+    assert lease.fail(1, "b", Exception("boom"))
+    assert lease.claim("c") == (1, "compound", 10, None)
+    assert lease.complete(1, "c", 5)
+
+    progress = lease.progress()
+    assert progress["done"] == 2 and progress["rows"] == 15
+    assert lease.finished()
+
+
+def test_lost_lease(tmp_path):
+    conn = f"sqlite:///{tmp_path / 'lease.db'}"
+    lease = LeaseTable(conn, lease_seconds=60)
+    lease.publish([("compound", None, None)])
+    assert lease.claim("a") == (0, "compound", None, None)
+    assert LeaseTable(conn, lease_seconds=-1).heartbeat(0, "a")
+    assert lease.claim("b") == (0, "compound", None, None)
+
+    # the heartbeat of the old owner flags the lease as lost
+    stop, lost = threading.Event(), threading.Event()
+    _heartbeat(LeaseTable(conn, lease_seconds=0.03), 0, "a", stop, lost)
+    assert lost.is_set()
+
+    # and its copy stops before writing a chunk, also when the heartbeat
+    # thread did not notice yet
+    metadata = MetaData()
+    table = Table("compound", metadata, Column("cid", Integer, primary_key=True))
+    o_conn, d_conn = (f"sqlite:///{tmp_path / name}" for name in ("o.db", "d.db"))
+    for db in (o_conn, d_conn):
+        metadata.create_all(create_engine(db))
+    with create_engine(o_conn).begin() as o:
+        o.execute(table.insert(), [{"cid": i} for i in range(10)])
+    with pytest.raises(CopyAborted):
+        fill_range(o_conn, d_conn, table, None, None, 5, abort=lost.is_set)
+    with pytest.raises(CopyAborted):
+        fill_range(
+            o_conn,
+            d_conn,
+            table,
+            None,
+            None,
+            5,
+            abort=lambda: not lease.heartbeat(0, "a"),
+        )
+    with create_engine(d_conn).connect() as d:
+        assert d.execute(select(func.count()).select_from(table)).scalar() == 0
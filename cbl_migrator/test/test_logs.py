@@ -0,0 +1,33 @@
+from ..logs import ChunkRateFilter, JsonFormatter
+import json
+import logging
+
+
+def make_record(level=logging.DEBUG, **extra):
+    record = logging.LogRecord(
+        "cbl_migrator", level, "migrator.py", 1, "Copied chunk", None, None
+    )
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter():
+    rec = json.loads(
+        JsonFormatter().format(make_record(table="compound", chunk=3, rows=10))
+    )
+    assert rec["message"] == "Copied chunk"
+    assert rec["level"] == "DEBUG"
+    assert (rec["table"], rec["chunk"], rec["rows"]) == ("compound", 3, 10)
+
+
+def test_chunk_rate_filter():
+    rate_filter = ChunkRateFilter(rate=2)
+    kept = [
+        rate_filter.filter(make_record(table="compound", chunk=i)) for i in range(10)
+    ]
+    assert sum(kept) == 2
+    # other tables and records without a chunk field are not limited
+    assert rate_filter.filter(make_record(table="compound_structure", chunk=1))
+    assert rate_filter.filter(make_record(table="compound"))
+    assert rate_filter.filter(make_record(logging.INFO, table="compound", chunk=11))
+    assert not ChunkRateFilter(rate=0).filter(make_record(chunk=1))
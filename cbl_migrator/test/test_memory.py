@@ -0,0 +1,23 @@
+from .. import memory
+from ..memory import MB, MemoryBudget
+
+
+def test_chunk_size_recovers(monkeypatch):
+    rss = [90 * MB]
+    monkeypatch.setattr(memory, "current_rss", lambda: rss[0])
+    budget = MemoryBudget(100 * MB, 1000)
+
+    assert budget.chunk_size(1000) == 500
+    assert budget.chunk_size(500) == 250
+
+    # back under the soft limit: chunks grow up to the configured size
+    rss[0] = 50 * MB
+    assert budget.chunk_size(250) == 500
+    assert budget.chunk_size(500) == 1000
+    assert budget.chunk_size(1000) == 1000
+    assert budget.peak == 90 * MB
+
+
+def test_no_cap(monkeypatch):
+    monkeypatch.setattr(memory, "current_rss", lambda: 900 * MB)
+    assert MemoryBudget(None, 1000).chunk_size(1000) == 1000
@@ -1,6 +1,16 @@
-from sqlalchemy import MetaData, create_engine, inspect, insert
+from sqlalchemy import MetaData, create_engine, inspect, insert, select, func
+from sqlalchemy.exc import OperationalError
 from .schema import Base, Compound, CompoundStructure, CompoundProperties
 from .. import DbMigrator
+from .. import faults
+from .. import migrator as migrator_module
+from ..faults import insert_rows
+from ..logs import setup_logger, stop_logging
+from ..migrator import fill_physical
+from ..origins import OriginPool
+from ..worker import run_worker
+import multiprocessing
+import shutil
 import pytest
 import random
 import os
@@ -229,3 +239,254 @@ class TestMigration:
         props_table = d_metadata.tables["compound_properties"]
         assert "logp" not in props_table.columns
         assert "mw" in props_table.columns
+
+    def __count_rows(self, url):
+        eng = create_engine(url)
+        metadata = MetaData()
+        metadata.reflect(eng)
+        with eng.connect() as conn:
+            return {
+                name: conn.execute(select(func.count()).select_from(table)).scalar()
+                for name, table in metadata.tables.items()
+            }
+
+    def test_09_subset_parents(self):
+        """Test subset migration pulling the referenced compounds"""
+        self.__gen_test_data()
+        migrator = DbMigrator(self.origin, self.dest)
+        assert migrator.migrate_subset({"compound_structure": "sid <= 3"}) is True
+        assert self.__count_rows(self.dest) == {
+            "compound": 3,
+            "compound_structure": 3,
+            "compound_properties": 0,
+        }
+
+    def test_10_subset_children(self):
+        """Test sampled subset migration including children"""
+        self.__gen_test_data()
+        migrator = DbMigrator(self.origin, self.dest)
+        assert (
+            migrator.migrate_subset(
+                ["compound"], sample_pct=10, include_children=True, chunk_size=3
+            )
+            is True
+        )
+        assert self.__count_rows(self.dest) == {
+            "compound": 4,
+            "compound_structure": 4,
+            "compound_properties": 4,
+        }
+
+    def test_11_memory_governance(self, tmp_path):
+        """Test migration recycling workers and shrinking chunks under a RSS cap"""
+        self.__gen_test_data()
+        log_file = str(tmp_path / "migration.log")
+        setup_logger(log_file=log_file)
+        migrator = DbMigrator(self.origin, self.dest)
+        try:
+            assert (
+                migrator.migrate(
+                    chunk_size=10, max_worker_memory=1, max_tasks_per_child=1
+                )
+                is True
+            )
+        finally:
+            stop_logging()
+        with open(log_file) as f:
+            log = f.read()
+        assert "reducing chunk size from 10 to 5" in log
+        assert "recycling workers" in log
+
+    def test_12_distributed_workers(self):
+        """Test a migration copied by several worker processes through a lease table"""
+        self.__gen_test_data()
+        lease_conn = "sqlite:///lease.db"
+        migrator = DbMigrator(self.origin, self.dest)
+        lease = migrator.publish_units(lease_conn, range_size=10)
+        assert lease.progress()["pending"] == 15
+
+        workers = [
+            multiprocessing.Process(
+                target=run_worker,
+                args=(lease_conn, self.origin, self.dest),
+                kwargs={"chunk_size": 5, "poll_seconds": 0.1},
+            )
+            for _ in range(3)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        progress = lease.progress()
+        assert progress["done"] == progress["units"] == 15
+        assert progress["rows"] == 41 * 3
+        assert migrator.finalize_units(lease_conn) is True
+        # a lease DB of its own keeps the lease table for the progress command
+        assert lease.progress()["done"] == 15
+        os.remove("lease.db")
+
+    def test_13_read_replicas(self, monkeypatch):
+        """Test PK-range jobs spread across an origin and a replica"""
+        self.__gen_test_data()
+        shutil.copy("origin.db", "replica.db")
+        picks = []
+        pick = OriginPool.pick
+
+        def record_pick(pool):
+            picks.append(pick(pool))
+            return picks[-1]
+
+        monkeypatch.setattr(OriginPool, "pick", record_pick)
+        migrator = DbMigrator(
+            [self.origin, "sqlite:///replica.db"], self.dest, reject_dir=None
+        )
+        assert migrator.migrate(chunk_size=5, range_size=10) is True
+        assert self.__count_rows(self.dest) == self.__count_rows(self.origin)
+        assert set(picks) == {self.origin, "sqlite:///replica.db"}
+        os.remove("replica.db")
+
+    def test_14_snapshot(self):
+        """Test migration reading the origin at a single snapshot"""
+        self.__gen_test_data()
+        migrator = DbMigrator(self.origin, self.dest)
+        assert migrator.migrate(chunk_size=10, snapshot=True) is True
+
+    def test_15_split_lobs(self):
+        """Test migration copying the LOB columns in a second pass"""
+        self.__gen_test_data()
+        migrator = DbMigrator(self.origin, self.dest)
+        assert (
+            migrator.migrate(
+                chunk_size=10, range_size=20, split_lobs=True, lob_chunk_size=7
+            )
+            is True
+        )
+        d_eng = create_engine(self.dest)
+        with d_eng.connect() as conn:
+            molblocks = conn.execute(
+                select(CompoundStructure.molblock).order_by(CompoundStructure.sid)
+            ).scalars()
+            assert list(molblocks) == [molblock] * 41
+            conn.execute(
+                CompoundStructure.__table__.update()
+                .where(CompoundStructure.sid == 3)
+                .values(molblock=None)
+            )
+            conn.commit()
+        assert migrator.validate_migration(split_lobs=True) is False
+
+    def test_16_optimize(self):
+        """Test the post-load statistics and vacuum of a SQLite destination"""
+        self.__gen_test_data()
+        migrator = DbMigrator(self.origin, self.dest)
+        assert migrator.migrate(chunk_size=10, optimize=True, sqlite_page_size=8192)
+        d_eng = create_engine(self.dest)
+        with d_eng.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA page_size").scalar() == 8192
+            stats = conn.exec_driver_sql("SELECT DISTINCT tbl FROM sqlite_stat1")
+            assert {"compound", "compound_structure"} <= set(stats.scalars())
+        assert migrator.validate_migration() is True
+
+    def test_22_lease_in_destination(self):
+        """Test the lease table in the destination is dropped once finalized"""
+        self.__gen_test_data()
+        migrator = DbMigrator(self.origin, self.dest)
+        migrator.publish_units(self.dest, range_size=10)
+        assert run_worker(self.dest, self.origin, self.dest, chunk_size=5) == 15
+        assert (
+            "cbl_migrator_lease" in inspect(create_engine(self.dest)).get_table_names()
+        )
+        assert migrator.finalize_units(self.dest) is True
+        assert "cbl_migrator_lease" not in self.__count_rows(self.dest)
+
+    def test_17_profile(self):
+        """Test the per table profiles and the merged hotspot report"""
+        self.__gen_test_data()
+        migrator = DbMigrator(self.origin, self.dest)
+        assert migrator.migrate(chunk_size=10, profile="profile") is True
+        with open(os.path.join("profile", "hotspots.txt")) as f:
+            report = f.read()
+        assert "compound_structure" in report
+        assert "statement compilation" in report
+        shutil.rmtree("profile")
+
+    def test_18_physical_chunking(self):
+        """Test migration by rowid ranges, including a table without PK"""
+        self.__gen_test_data()
+        o_eng = create_engine(self.origin)
+        with o_eng.begin() as conn:
+            conn.exec_driver_sql("CREATE TABLE activity_log (cid INTEGER, note TEXT)")
+            conn.exec_driver_sql(
+                "INSERT INTO activity_log VALUES "
+                + ", ".join(f"({i % 5}, 'seen')" for i in range(25))
+            )
+        assert "activity_log" in DbMigrator(self.origin, self.dest).exclude_tables
+
+        migrator = DbMigrator(self.origin, self.dest, chunking="physical")
+        assert "activity_log" not in migrator.exclude_tables
+        assert migrator.migrate(chunk_size=4, range_size=10) is True
+        counts = self.__count_rows(self.dest)
+        assert counts["activity_log"] == 25
+        # the ranges are dropped with the migration validated
+        assert "cbl_migrator_units" not in counts
+
+        # tables of a migration validated are not copied again
+        assert migrator.migrate(chunk_size=4, range_size=10) is True
+        assert self.__count_rows(self.dest) == counts
+
+        # a table emptied in the destination is copied again
+        with create_engine(self.dest).begin() as conn:
+            conn.exec_driver_sql("DELETE FROM activity_log")
+        assert migrator.migrate(chunk_size=4, range_size=10) is True
+        assert self.__count_rows(self.dest) == counts
+
+        # subsets need PKs to follow the FKs
+        with pytest.raises(Exception, match="subset"):
+            migrator.migrate_subset(["compound"])
+
+    def test_19_stale_rejects(self, tmp_path):
+        """Test rejects left by a previous migration are cleared on a fresh copy"""
+        self.__gen_test_data()
+        with open(tmp_path / "compound.jsonl", "w") as f:
+            f.write('{"pk": [1000], "row": {"cid": 1000}, "error": "stale"}\n')
+        migrator = DbMigrator(self.origin, self.dest, reject_dir=str(tmp_path))
+        assert migrator.migrate(chunk_size=10) is True
+        assert not os.path.exists(tmp_path / "compound.jsonl")
+
+    def test_21_rejects_fail_validation(self, tmp_path):
+        """Test quarantined rows fail validation unless rejects are accepted"""
+        self.__gen_test_data()
+        migrator = DbMigrator(self.origin, self.dest, reject_dir=str(tmp_path))
+        assert migrator.migrate(chunk_size=10) is True
+        with create_engine(self.dest).begin() as conn:
+            conn.exec_driver_sql("DELETE FROM compound_properties WHERE pid = 41")
+        with open(tmp_path / "compound_properties.jsonl", "w") as f:
+            f.write('{"pk": [41], "row": {"pid": 41}, "error": "refused"}\n')
+        assert migrator.validate_migration() is False
+        migrator = DbMigrator(
+            self.origin, self.dest, reject_dir=str(tmp_path), accept_rejects=True
+        )
+        assert migrator.validate_migration() is True
+
+    def test_20_physical_range_atomic(self, monkeypatch):
+        """Test a physical range hitting a transient error is copied once"""
+        self.__gen_test_data()
+        Base.metadata.create_all(create_engine(self.dest))
+        metadata = MetaData()
+        metadata.reflect(create_engine(self.dest))
+        calls = []
+
+        def flaky_insert(*args):
+            calls.append(1)
+            if len(calls) == 3:
+                raise OperationalError(
+                    "INSERT", {}, Exception("disconnect"), connection_invalidated=True
+                )
+            return insert_rows(*args)
+
+        monkeypatch.setattr(migrator_module, "insert_rows", flaky_insert)
+        monkeypatch.setattr(faults.time, "sleep", lambda seconds: None)
+        table = metadata.tables["compound"]
+        assert fill_physical(self.origin, self.dest, table, None, None, 10) == 41
+        assert self.__count_rows(self.dest)["compound"] == 41
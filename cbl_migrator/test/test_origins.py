@@ -0,0 +1,50 @@
+from ..origins import OriginPool
+
+
+def test_pick_by_latency():
+    pool = OriginPool(["primary", "replica"])
+    pool.latency = {"primary": 0.1, "replica": 0.3}
+    assert pool.pick() == "primary"
+    assert pool.pick() == "primary"
+    # 0.1 * 3 jobs running is now worse than 0.3 * 1
+    assert pool.pick() == "replica"
+    assert pool.running == {"primary": 2, "replica": 1}
+
+
+def test_exclude_slow_and_failing():
+    pool = OriginPool(["primary", "replica1", "replica2"], slow_factor=5)
+    for _ in range(OriginPool.MIN_SAMPLES):
+        for origin, latency in [("primary", 0.1), ("replica1", 1.0), ("replica2", 0.1)]:
+            pool.running[origin] += 1
+            pool.done(origin, latency)
+    assert pool.excluded == {"replica1"}
+
+    for _ in range(OriginPool.MAX_FAILURES):
+        pool.failed("replica2")
+    assert pool.excluded == {"replica1", "replica2"}
+
+    # the last origin is never excluded
+    for _ in range(OriginPool.MAX_FAILURES):
+        pool.failed("primary")
+    assert pool.available == ["primary"]
+    assert pool.pick() == "primary"
+
+
+def test_probe_unreachable(tmp_path):
+    replica = f"sqlite:///{tmp_path / 'replica.db'}"
+    pool = OriginPool(["sqlite:////nonexistent/origin.db", replica])
+    pool.probe()
+    assert pool.available == [replica]
+    assert pool.pick() == replica
+
+
+def test_measure_every_origin_first():
+    pool = OriginPool(["primary", "replica"])
+    pool.latency = {"primary": 0.1, "replica": 0.2}
+    picks = []
+    for _ in range(2 * OriginPool.MIN_SAMPLES):
+        picks.append(pool.pick())
+        pool.done(picks[-1], pool.latency[picks[-1]])
+    assert picks.count("replica") == OriginPool.MIN_SAMPLES
+    # then jobs go to the fastest one
+    assert pool.pick() == "primary"
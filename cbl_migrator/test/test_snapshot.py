@@ -0,0 +1,65 @@
+from sqlalchemy import create_engine
+from types import SimpleNamespace
+from ..snapshot import apply_snapshot
+
+
+class RecordedConnection:
+    """
+    DBAPI connection recording the statements run by its cursors.
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return SimpleNamespace(
+            execute=lambda stmt, **params: self.statements.append((stmt, params)),
+            close=lambda: None,
+        )
+
+
+def engine_named(name):
+    eng = create_engine("sqlite://")
+    eng.dialect.name = name
+    return eng
+
+
+def listeners(eng):
+    """
+    Begin and connect listeners of an engine, besides those of the dialect.
+    """
+    return list(eng.dispatch.begin), list(eng.pool.dispatch.connect)
+
+
+def test_postgresql_snapshot():
+    eng = engine_named("postgresql")
+    apply_snapshot(eng, {"dialect": "postgresql", "snapshot_id": "00000003-1B-1"})
+    dbapi_conn = RecordedConnection()
+    eng.dispatch.begin(SimpleNamespace(connection=dbapi_conn))
+    assert dbapi_conn.statements == [
+        ("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ", {}),
+        ("SET TRANSACTION SNAPSHOT '00000003-1B-1'", {}),
+    ]
+
+
+def test_oracle_snapshot():
+    eng = engine_named("oracle")
+    _, dialect_connect = listeners(eng)
+    apply_snapshot(eng, {"dialect": "oracle", "scn": 123456})
+    dbapi_conn = RecordedConnection()
+    for fn in eng.pool.dispatch.connect:
+        if fn not in dialect_connect:
+            fn(dbapi_conn, None)
+    assert dbapi_conn.statements == [
+        (
+            "BEGIN DBMS_FLASHBACK.ENABLE_AT_SYSTEM_CHANGE_NUMBER(:scn); END;",
+            {"scn": 123456},
+        )
+    ]
+
+
+def test_snapshot_of_other_dialect():
+    eng = engine_named("postgresql")
+    before = listeners(eng)
+    apply_snapshot(eng, {"dialect": "oracle", "scn": 123456})
+    assert listeners(eng) == before
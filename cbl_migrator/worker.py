@@ -0,0 +1,130 @@
+from sqlalchemy import MetaData, create_engine
+import os
+import socket
+import threading
+import time
+from .faults import CopyAborted, is_transient
+from .lease import LeaseTable
+from .logs import logger
+from .memory import MB
+from .migrator import READ_LATENCIES, fill_range, mean_read_latency
+from .origins import OriginPool
+
+
+def _heartbeat(lease, unit_id, owner, stop, lost):
+    """
+    Extends the lease of a unit until stop is set. Sets lost if the
+    lease was lost, for the copy to be abandoned.
+    """
+    while not stop.wait(lease.lease_seconds / 3):
+        try:
+            if not lease.heartbeat(unit_id, owner):
+                logger.warning(f"Lost the lease of unit {unit_id}")
+                lost.set()
+                return
+        except Exception as e:
+            logger.warning(f"Heartbeat of unit {unit_id} failed: {e}")
+
+
+def run_worker(
+    lease_conn_string,
+    o_conn_string,
+    d_conn_string,
+    chunk_size=1000,
+    lease_seconds=60,
+    poll_seconds=5,
+    max_worker_memory=None,
+    reject_dir=None,
+    owner=None,
+):
+    """
+    Claims and copies work units published in a lease table until
+    none is left. Several workers can run on any number of hosts, a unit
+    whose worker stops heartbeating is taken over once its lease expires.
+    Before writing each chunk a worker checks it still owns its unit,
+    extending its lease, and otherwise stops copying it and leaves it to
+    the new owner.
+
+    Args:
+        lease_conn_string (str): Connection string of the DB holding the lease table.
+        o_conn_string (str | list[str]): Origin DB connection string, or the
+            primary followed by read replicas to spread the reads across.
+        d_conn_string (str): Destination DB connection string.
+        chunk_size (int): Batch size for chunked copying.
+        lease_seconds (float): Lease duration, renewed every third of it.
+        poll_seconds (float): Wait between claims while other workers still
+            hold units that could expire.
+        max_worker_memory (int): RSS cap in MB, chunks shrink close to it.
+        reject_dir (str): Directory or DB connection string where refused rows
+            are quarantined, the lease DB lets the coordinator see the rejects
+            of every host. None to fail the unit instead.
+        owner (str): Worker name, host:pid by default.
+
+    Returns:
+        int: Number of units copied by this worker.
+    """
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+    lease = LeaseTable(lease_conn_string, lease_seconds=lease_seconds)
+    max_memory = max_worker_memory * MB if max_worker_memory else None
+    origins = OriginPool(o_conn_string)
+
+    metadata = MetaData()
+    metadata.reflect(create_engine(d_conn_string))
+
+    logger.info(f"Worker {owner} started")
+    n_units = 0
+    while True:
+        unit = lease.claim(owner)
+        if unit is None:
+            if lease.finished():
+                break
+            time.sleep(poll_seconds)
+            continue
+
+        unit_id, table_name, lo, hi = unit
+        stop = threading.Event()
+        lost = threading.Event()
+        beat = threading.Thread(
+            target=_heartbeat, args=(lease, unit_id, owner, stop, lost), daemon=True
+        )
+        beat.start()
+        origin = origins.pick()
+        del READ_LATENCIES[:]
+        try:
+            rows = fill_range(
+                origin,
+                d_conn_string,
+                metadata.tables[table_name],
+                lo,
+                hi,
+                chunk_size,
+                max_memory,
+                reject_dir,
+                abort=lambda: lost.is_set() or not lease.heartbeat(unit_id, owner),
+            )
+            origins.done(origin, mean_read_latency())
+            if lost.is_set() or not lease.complete(unit_id, owner, rows):
+                logger.warning(
+                    f"Unit {unit_id} of '{table_name}' copied after its lease "
+                    "was lost, leaving it to its new owner"
+                )
+            else:
+                n_units += 1
+        except CopyAborted:
+            logger.warning(
+                f"Abandoned unit {unit_id} of '{table_name}' after losing its lease"
+            )
+            origins.release(origin)
+        except Exception as e:
+            logger.error(f"Unit {unit_id} of '{table_name}' failed: {e}")
+            lease.fail(unit_id, owner, e)
+            if is_transient(e):
+                origins.failed(origin, running=True)
+            else:
+                origins.release(origin)
+        finally:
+            stop.set()
+            beat.join()
+
+    logger.info(f"Worker {owner} finished after copying {n_units} units")
+    return n_units